@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gigflow.settings')
 
 application = get_asgi_application()
+
+# every worker process listens for the cache invalidations of the others
+from services import autocomplete, invalidation  # noqa: E402
+
+invalidation.start()
+autocomplete.warm_up()
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent identical calls
+
+    The first caller of a key (the leader) runs the computation, callers of the
+    same key arriving before it finishes wait for its result instead of running
+    it again. The threads of a process share the in-flight calls. The
+    counters are logged at most every ``stats_interval`` seconds.
+    """
+
+    def __init__(
+        self, name: str, timeout: float, stats_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            name (str): name used in logs
+            timeout (float): seconds a caller waits for the leader before
+                running the computation itself
+            stats_interval (Optional[float]): seconds between two logs of the
+                counters, None never logs them
+        """
+        self.name = name
+        self.timeout = timeout
+        self.stats_interval = stats_interval
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+        self._logged_at = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        """counters of leaders, coalesced callers, wait timeouts and errors"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """get the in-flight call of a key, creating it if there is none
+
+        Returns:
+            Tuple[Future, bool]: call future and if the caller is the leader
+        """
+        with self._lock:
+            if key in self._calls:
+                self._stats["coalesced"] += 1
+                return self._calls[key], False
+            future = self._calls[key] = Future()
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any, error: Any) -> None:
+        log = False
+        with self._lock:
+            del self._calls[key]
+            if error is not None:
+                self._stats["errors"] += 1
+            now = time.monotonic()
+            if (
+                self.stats_interval is not None
+                and now - self._logged_at >= self.stats_interval
+            ):
+                self._logged_at, log = now, True
+                stats = dict(self._stats)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        if log:
+            logger.info("%s: %s", self.name, stats)
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """run a computation once for every concurrent caller of a key
+
+        Args:
+            key (Hashable): identity of the computation
+            function (Callable[[], Any]): computation to run
+        Returns:
+            Any: result of the computation
+        """
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                self._count("timeouts")
+                logger.warning("%s: timed out waiting for %r", self.name, key)
+                return function()
+        try:
+            result = function()
+        except BaseException as error:
+            self._finish(key, future, None, error)
+            raise
+        self._finish(key, future, result, None)
+        return result
@@ -7,9 +7,11 @@ env_path = Path(".") / ".env"
 main.load_dotenv()
 
 
-def load_env(prop: str, cast: type = str) -> Any:
+def load_env(prop: str, cast: type = str, default: Any = None) -> Any:
     """Load environment variable and cast it to the specified type."""
     env = os.getenv(prop)
+    if env is None:
+        return default
     if cast == bool:
-        env = True if env.lower == "true" else False
+        env = True if env.lower() == "true" else False
     return cast(env)
@@ -0,0 +1,204 @@
+import datetime
+import decimal
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db.models import Model, Q
+from django.utils import dateparse, timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import exceptions
+
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in ("true", "1"):
+        return True
+    if value.lower() in ("false", "0"):
+        return False
+    raise ValueError("Must be true or false.")
+
+
+def parse_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("Must be an integer.")
+
+
+def parse_decimal(value: str) -> decimal.Decimal:
+    try:
+        number = decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        raise ValueError("Must be a number.")
+    if not number.is_finite():
+        raise ValueError("Must be a number.")
+    return number
+
+
+def parse_datetime(value: str) -> datetime.datetime:
+    """parse an ISO 8601 datetime or date, dates start at midnight"""
+    try:
+        parsed = dateparse.parse_datetime(value)
+        if parsed is None and (date := dateparse.parse_date(value)):
+            parsed = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError("Must be an ISO 8601 date or datetime.")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_str(value: str) -> str:
+    return value
+
+
+def canonical(value: Any) -> str:
+    """format a parsed value the same way whatever its input spelling"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, decimal.Decimal):
+        return format(value.normalize(), "f")
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).isoformat()
+    return str(value)
+
+
+SCHEMA_TYPES = {
+    parse_bool: OpenApiTypes.BOOL,
+    parse_int: OpenApiTypes.INT,
+    parse_decimal: OpenApiTypes.DECIMAL,
+    parse_datetime: OpenApiTypes.DATETIME,
+    parse_str: OpenApiTypes.STR,
+}
+
+
+@dataclass(frozen=True)
+class Filter:
+    """A query param compiled into a field lookup
+
+    Args:
+        param (str): query param name
+        field (str): model field name
+        lookup (str): lookup applied to the field, e.g. ``gte``
+        parse (Callable[[str], Any]): converts the param, raising ValueError
+        description (str): param description in the docs
+        requires (Optional[str]): param that must be present for this one to apply
+        wrap (Optional[Callable[[Any], Any]]): builds the lookup value from the
+            parsed one, e.g. a list for a JSON contains lookup
+    """
+
+    param: str
+    field: str
+    lookup: str
+    parse: Callable[[str], Any]
+    description: str = ""
+    requires: Optional[str] = None
+    wrap: Optional[Callable[[Any], Any]] = None
+
+    @property
+    def inline(self) -> bool:
+        """the value is written in the SQL instead of sent as a param, e.g.
+        ``"active"`` or ``NOT "active"`` for booleans"""
+        return self.parse is parse_bool
+
+    def lookup_value(self, value: Any) -> Any:
+        return self.wrap(value) if self.wrap else value
+
+    def q(self, value: Any) -> Q:
+        return Q(**{f"{self.field}__{self.lookup}": self.lookup_value(value)})
+
+    def db_param(self, model: Model, value: Any, connection) -> Any:
+        """get the SQL param django sends for the lookup of a value"""
+        value = self.lookup_value(value)
+        if self.lookup == "icontains":
+            return f"%{connection.ops.prep_for_like_query(value)}%"
+        field = model._meta.get_field(self.field)
+        return field.get_db_prep_value(value, connection, prepared=False)
+
+
+class CompiledFilters:
+    """Parsed values of the filters present in a request"""
+
+    def __init__(self, filter_set: "FilterSet", values: Dict[str, Any]):
+        self.filter_set = filter_set
+        self.values = values
+
+    @property
+    def shape(self) -> Tuple[Any, ...]:
+        """params present and inline values, which decide the SQL"""
+        filters = self.filter_set.filters
+        return tuple(
+            (param, canonical(value)) if filters[param].inline else param
+            for param, value in self.values.items()
+        )
+
+    @property
+    def key(self) -> Tuple[Tuple[str, str], ...]:
+        """canonical params, equal for requests filtering the same rows"""
+        return tuple((param, canonical(value)) for param, value in self.values.items())
+
+    @property
+    def q(self) -> Q:
+        filters = Q()
+        for param, value in self.values.items():
+            filters &= self.filter_set.filters[param].q(value)
+        return filters
+
+    def db_params(self, connection) -> List[Any]:
+        """SQL params of the filters, in the order of the compiled WHERE"""
+        return [
+            self.filter_set.filters[param].db_param(self.filter_set.model, value, connection)
+            for param, value in self.values.items()
+            if not self.filter_set.filters[param].inline
+        ]
+
+
+class FilterSet:
+    """Declared filters of a list endpoint
+
+    Query params are parsed into typed values before any query runs, invalid
+    values are rejected with a 400 and empty ones are ignored.
+    """
+
+    def __init__(self, model: Model, *filters: Filter):
+        self.model = model
+        self.filters = {filter.param: filter for filter in filters}
+
+    def compile(self, params: dict) -> CompiledFilters:
+        """parse the filter params of a request
+
+        Args:
+            params (dict): query params
+        Returns:
+            CompiledFilters: parsed values in declaration order
+        Raises:
+            ValidationError: some param is invalid
+        """
+        values, errors = {}, {}
+        for param, filter in self.filters.items():
+            raw = params.get(param)
+            if raw in (None, ""):
+                continue
+            if filter.requires and filter.requires not in values:
+                continue
+            try:
+                values[param] = filter.parse(raw)
+            except ValueError as error:
+                errors[param] = [str(error)]
+        if errors:
+            raise exceptions.ValidationError(errors)
+        return CompiledFilters(self, values)
+
+    def parameters(self) -> List[OpenApiParameter]:
+        """document the filters as query params"""
+        return [
+            OpenApiParameter(
+                filter.param,
+                SCHEMA_TYPES.get(filter.parse, OpenApiTypes.STR),
+                OpenApiParameter.QUERY,
+                description=filter.description,
+            )
+            for filter in self.filters.values()
+        ]
@@ -1,6 +1,7 @@
 from typing import List
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 BASEPAGE = 1
 
@@ -27,6 +28,29 @@ class CustomPagination(PageNumberPagination):
             }
         )
 
+    def relink(self, request, data: dict) -> dict:
+        """Point the links of a paginated response to another request
+        Args:
+            request: request receiving the response
+            data (dict): paginated response of an identical request
+        Returns:
+            dict: copy of the response with the links of the request
+        """
+        url = request.build_absolute_uri()
+        page = data["current_page"]
+        data = dict(data)
+        if data["next_page_url"] is not None:
+            data["next_page_url"] = replace_query_param(
+                url, self.page_query_param, page + 1
+            )
+        if data["last_page_url"] is not None:
+            data["last_page_url"] = (
+                remove_query_param(url, self.page_query_param)
+                if page - 1 == 1
+                else replace_query_param(url, self.page_query_param, page - 1)
+            )
+        return data
+
     def get_paginated_response_schema(self, schema: List[dict]) -> dict:
         """Custom pagination response schema
         Args:
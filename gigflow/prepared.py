@@ -0,0 +1,218 @@
+import hashlib
+import itertools
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+
+from django.conf import settings
+from django.core import checks
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import QuerySet
+
+# django escapes literal % as %% in the SQL it sends with params
+PLACEHOLDER = re.compile(r"%%|%s")
+
+
+def positional(sql: str) -> str:
+    """turn the %s placeholders of django's SQL into $1, $2..."""
+    numbers = itertools.count(1)
+    return PLACEHOLDER.sub(
+        lambda match: "%" if match.group() == "%%" else f"${next(numbers)}", sql
+    )
+
+
+def reuses_connections(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """check if connections outlive a request, prepared statements live as long
+    as their connection"""
+    return connections[using].settings_dict["CONN_MAX_AGE"] != 0
+
+
+@checks.register()
+def check_connection_reuse(app_configs, **kwargs) -> List[checks.CheckMessage]:
+    if not settings.PREPARED_STATEMENTS["ENABLED"] or reuses_connections():
+        return []
+    return [
+        checks.Warning(
+            "PREPARED_STATEMENTS is enabled but CONN_MAX_AGE is 0",
+            hint=(
+                "Every request opens a new connection, so statements would be "
+                "prepared again on each one. They are skipped until "
+                "DATABASE_CONN_MAX_AGE is set."
+            ),
+            id="gigflow.W001",
+        )
+    ]
+
+
+class Statement:
+    """SQL prepared once per database connection and then only executed"""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.name = f"gigflow_{hashlib.sha1(sql.encode()).hexdigest()[:16]}"
+
+    def execute(self, connection, params: List[Any]) -> List[tuple]:
+        with connection.cursor() as cursor:
+            prepared = self._prepared(connection)
+            if self.name in prepared:
+                prepared.move_to_end(self.name)
+            else:
+                while len(prepared) >= settings.PREPARED_STATEMENTS["MAX_PER_CONNECTION"]:
+                    cursor.execute(f"DEALLOCATE {prepared.popitem(last=False)[0]}")
+                cursor.execute(f"PREPARE {self.name} AS {self.sql}")
+                prepared[self.name] = True
+            if params:
+                placeholders = ", ".join(["%s"] * len(params))
+                cursor.execute(f"EXECUTE {self.name} ({placeholders})", params)
+            else:
+                cursor.execute(f"EXECUTE {self.name}")
+            return cursor.fetchall()
+
+    def _prepared(self, connection) -> "OrderedDict[str, bool]":
+        """names prepared on the current connection, in least recently used order
+
+        Prepared statements live as long as the session, they are not undone by
+        a rollback, so the names are only forgotten when django reconnects.
+        """
+        raw, prepared = getattr(connection, "_gigflow_prepared", (None, None))
+        if raw is not connection.connection:
+            prepared = OrderedDict()
+            connection._gigflow_prepared = (connection.connection, prepared)
+        return prepared
+
+
+class PreparedQuery:
+    """Paginable rows of a prepared query shape
+
+    Implements the ``count()`` and slicing used by django's ``Paginator``.
+    """
+
+    ordered = True
+
+    def __init__(self, shape: "Shape", params: List[Any]):
+        self.shape = shape
+        self.params = params
+
+    def count(self) -> int:
+        return self.shape.count.execute(connections[self.shape.using], self.params)[0][0]
+
+    def __getitem__(self, page: slice) -> List[tuple]:
+        if not isinstance(page, slice) or page.step:
+            raise TypeError("prepared queries only support slices without step")
+        start = page.start or 0
+        limit = None if page.stop is None else max(page.stop - start, 0)
+        connection = connections[self.shape.using]
+        rows = self.shape.page.execute(connection, self.params + [limit, start])
+        return self.shape.convert(rows, connection)
+
+
+class Shape:
+    """Statements of the count and the pages of a query"""
+
+    def __init__(self, queryset: QuerySet):
+        compiler = queryset.query.get_compiler(queryset.db)
+        sql, params = compiler.as_sql()
+        # limit and offset go after the params of the query, see PreparedQuery
+        self.page = Statement(
+            f"{positional(sql)} LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}"
+        )
+        count_sql, _ = queryset.order_by().values("pk").query.sql_with_params()
+        self.count = Statement(f"SELECT COUNT(*) FROM ({positional(count_sql)}) subquery")
+        self.using = queryset.db
+        # from_db_value of the selected fields, e.g. json.loads for JSONField
+        self.converters = compiler.get_converters(
+            [expression for expression, _, _ in compiler.select]
+        )
+
+    def convert(self, rows: List[tuple], connection) -> List[tuple]:
+        """convert the raw values of the rows like django does"""
+        if not self.converters:
+            return rows
+        converted = []
+        for row in rows:
+            row = list(row)
+            for position, (functions, expression) in self.converters.items():
+                for function in functions:
+                    row[position] = function(row[position], expression, connection)
+            converted.append(tuple(row))
+        return converted
+
+
+class PreparedQueries:
+    """Server side prepared statements for the hot shapes of a query
+
+    A shape is the SQL of a query without its params, e.g. a list filtered by
+    title and minimum price. Once a shape was seen ``HOT_AFTER`` times its SQL
+    is compiled one last time and prepared on each connection, later queries
+    of the shape skip django's SQL compilation and PostgreSQL's parsing and,
+    after a few executions, planning. Statements are only worth preparing on
+    persistent connections, without ``CONN_MAX_AGE`` queries run through
+    django. See ``PREPARED_STATEMENTS`` in the settings.
+    """
+
+    def __init__(self, name: str, using: str = DEFAULT_DB_ALIAS):
+        self.name = name
+        self.using = using
+        self._lock = threading.Lock()
+        self._hits: Counter = Counter()
+        # None marks shapes whose params can not be computed without django
+        self._shapes: Dict[Hashable, Optional[Shape]] = {}
+        self._stats = {"prepared": 0, "fallbacks": 0, "unsupported": 0}
+
+    def stats(self) -> Dict[str, int]:
+        """counters of prepared shapes, queries run by django and unsupported shapes"""
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hits.clear()
+            self._shapes.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def query(
+        self,
+        key: Hashable,
+        params: List[Any],
+        queryset: Callable[[], QuerySet],
+    ) -> Union[PreparedQuery, QuerySet]:
+        """get the rows of a query shape, prepared if it is hot
+
+        Args:
+            key (Hashable): identifies the shape, its SQL must not vary
+            params (List[Any]): SQL params of the query, as django sends them
+            queryset (Callable[[], QuerySet]): builds the query of the params,
+                only called while the shape is not prepared
+        Returns:
+            Union[PreparedQuery, QuerySet]: rows for the paginator
+        """
+        config = settings.PREPARED_STATEMENTS
+        if not config["ENABLED"] or not reuses_connections(self.using):
+            return queryset()
+        with self._lock:
+            shape = self._shapes.get(key)
+            if shape is None:
+                self._hits[key] += 1
+                hot = key not in self._shapes and self._hits[key] >= config["HOT_AFTER"]
+        if shape is not None:
+            return PreparedQuery(shape, list(params))
+
+        built = queryset()
+        if not hot:
+            self._count("fallbacks")
+            return built
+        _, expected = built.query.sql_with_params()
+        with self._lock:
+            if list(expected) != list(params):
+                # the caller does not send the params django would, keep using django
+                self._shapes[key] = None
+                self._stats["unsupported"] += 1
+                return built
+            shape = self._shapes[key] = Shape(built)
+            self._stats["prepared"] += 1
+        return PreparedQuery(shape, list(params))
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
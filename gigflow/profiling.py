@@ -0,0 +1,207 @@
+import cProfile
+import hmac
+import io
+import itertools
+import json
+import logging
+import marshal
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("pstats", "collapsed")
+
+
+class StackSampler:
+    """Sample the stack of a thread from a background thread
+
+    Stacks are counted in the collapsed format read by flame graph tools, one
+    ``frame;frame;frame count`` line per distinct stack.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+
+    def enable(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def disable(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dumps(self) -> bytes:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        ).encode()
+
+
+class QueryRecorder:
+    """Execute wrapper recording the SQL run by a request"""
+
+    def __init__(self):
+        self.queries: List[dict] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "sql": sql,
+                    "many": many,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                }
+            )
+
+
+class ProfilingMiddleware:
+    """Profile single requests of the configured endpoints
+
+    A trusted caller asks for a profile with the ``X-Profile`` header or the
+    ``profile`` query param set to ``pstats`` or ``collapsed``, and gets back a
+    zip with the call profile and the executed SQL instead of the response.
+    Besides, one in ``SAMPLE_RATE`` requests of every endpoint is profiled and
+    stored in ``OUTPUT_DIR``. See ``PROFILING`` in the settings.
+    """
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+        self._counters: Dict[str, itertools.count] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        config = settings.PROFILING
+        if not config["ENABLED"]:
+            return self.get_response(request)
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return self.get_response(request)
+        if url_name not in config["URL_NAMES"]:
+            return self.get_response(request)
+
+        requested = self._requested_format(request)
+        if requested and self._is_trusted(request):
+            response, artifact = self._profile(request, requested)
+            self._store(url_name, requested, artifact)
+            return self._download(url_name, requested, artifact)
+        if self._is_sampled(url_name):
+            response, artifact = self._profile(request, config["SAMPLE_FORMAT"])
+            self._store(url_name, config["SAMPLE_FORMAT"], artifact)
+            return response
+        return self.get_response(request)
+
+    def _requested_format(self, request: HttpRequest) -> Optional[str]:
+        """get the profile format asked by the request, if any"""
+        value = request.headers.get("X-Profile") or request.GET.get(
+            settings.PROFILING["QUERY_PARAM"]
+        )
+        if not value:
+            return None
+        if value in FORMATS:
+            return value
+        return "pstats" if value.lower() in ("1", "true") else None
+
+    def _is_trusted(self, request: HttpRequest) -> bool:
+        """check if the caller may profile requests"""
+        config = settings.PROFILING
+        if request.META.get("REMOTE_ADDR") in config["TRUSTED_IPS"]:
+            return True
+        token = request.headers.get("X-Profile-Token")
+        return bool(config["TOKEN"] and token) and hmac.compare_digest(
+            token, config["TOKEN"]
+        )
+
+    def _is_sampled(self, url_name: str) -> bool:
+        """count the request and check if it is one of the sampled ones"""
+        rate = settings.PROFILING["SAMPLE_RATE"]
+        if not rate or not settings.PROFILING["OUTPUT_DIR"]:
+            return False
+        with self._lock:
+            counter = self._counters.setdefault(url_name, itertools.count())
+            return next(counter) % rate == 0
+
+    def _profile(self, request: HttpRequest, format: str):
+        """run the request under a profiler
+
+        Returns:
+            Tuple[HttpResponse, bytes]: response and zip artifact
+        """
+        profiler = cProfile.Profile() if format == "pstats" else StackSampler()
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+
+        if format == "pstats":
+            profiler.create_stats()
+            profile = marshal.dumps(profiler.stats)
+        else:
+            profile = profiler.dumps()
+        artifact = io.BytesIO()
+        with zipfile.ZipFile(artifact, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(f"profile.{format}", profile)
+            archive.writestr("queries.json", json.dumps(recorder.queries, indent=2))
+            archive.writestr(
+                "request.json",
+                json.dumps(
+                    {
+                        "method": request.method,
+                        "path": request.get_full_path(),
+                        "status": response.status_code,
+                    }
+                ),
+            )
+        return response, artifact.getvalue()
+
+    def _filename(self, url_name: str, format: str) -> str:
+        return f"{url_name}-{time.time_ns()}-{format}.zip"
+
+    def _store(self, url_name: str, format: str, artifact: bytes) -> None:
+        """write a profile to the output directory, if configured"""
+        output_dir = settings.PROFILING["OUTPUT_DIR"]
+        if not output_dir:
+            return
+        path = Path(output_dir) / self._filename(url_name, format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(artifact)
+        logger.info("stored %s profile of %s in %s", format, url_name, path)
+
+    def _download(self, url_name: str, format: str, artifact: bytes) -> HttpResponse:
+        response = HttpResponse(artifact, content_type="application/zip")
+        response["Content-Disposition"] = (
+            f'attachment; filename="{self._filename(url_name, format)}"'
+        )
+        return response
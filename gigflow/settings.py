@@ -58,6 +58,9 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     # packages
     "corsheaders.middleware.CorsMiddleware",
+    # gigflow
+    "gigflow.slow_queries.SlowQueryMiddleware",
+    "gigflow.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "gigflow.urls"
@@ -92,10 +95,152 @@ DATABASES = {
         "PASSWORD": load_env("DATABASE_PASS", str),
         "HOST": load_env("DATABASE_HOST", str),
         "PORT": load_env("DATABASE_PORT", str),
+        # seconds a connection is reused by the requests of a worker, 0 closes
+        # it after every request
+        "CONN_MAX_AGE": load_env("DATABASE_CONN_MAX_AGE", int, 0),
         "TEST": {"NAME": load_env("DATABASE_NAME_TEST", str)},
     }
 }
 
+# Monthly range partitioning of the services table by created_at
+SERVICES_PARTITIONING = {
+    "ENABLED": load_env("SERVICES_PARTITIONING", bool, False),
+    # partitions created ahead of the current month
+    "MONTHS_AHEAD": 3,
+    # months kept attached, older partitions get detached (None keeps all)
+    "RETAIN_MONTHS": None,
+}
+
+# Inactive services moved to the services_archive table
+SERVICES_ARCHIVE = {
+    # days a service must stay inactive before being archived
+    "INACTIVE_DAYS": 90,
+    "BATCH_SIZE": 1000,
+}
+
+# Invalidation of the in-process caches of every worker, see
+# services.invalidation
+CACHE_INVALIDATION = {
+    "ENABLED": load_env("CACHE_INVALIDATION", bool, True),
+    # "notify" uses LISTEN/NOTIFY, "poll" reads the cache_invalidations table
+    "MODE": load_env("CACHE_INVALIDATION_MODE", str, "notify"),
+    "CHANNEL": "gigflow_invalidation",
+    # seconds between reads in poll mode, or LISTEN wake ups in notify mode
+    "POLL_INTERVAL": 1.0,
+    # seconds the cache_invalidations rows are kept in poll mode
+    "RETENTION_SECONDS": 3600,
+    # seconds poll mode waits for the rows of transactions that committed
+    # after a later one, longer transactions lose their changes
+    "GAP_SECONDS": 300,
+    # seconds between two logs of the counters of every listener, None disables
+    "STATS_INTERVAL": 60,
+}
+
+# In-process cache of the active service documents served by the detail and
+# batch endpoints
+SERVICE_DOCUMENT_CACHE = {
+    "MAX_SIZE": 10000,
+    # seconds, bounds staleness after writes that do not publish a change
+    "TTL": 60,
+}
+
+# Maximum number of ids accepted by the services batch endpoint
+SERVICES_BATCH_MAX_IDS = 100
+
+# TF-IDF index of the similar services endpoint, see services.similarity
+SIMILARITY_INDEX = {
+    # builds of build_similarity_index, the current one is the current symlink
+    "DIRECTORY": load_env(
+        "SIMILARITY_INDEX_DIR", str, str(BASE_DIR / "similarity_index")
+    ),
+    # hashed word space, changing it requires a rebuild
+    "FEATURES": 2**18,
+    "DEFAULT_LIMIT": 10,
+    "MAX_LIMIT": 50,
+    # older builds are deleted
+    "KEEP_BUILDS": 2,
+    # services written since the build that start a rebuild in the background
+    "REBUILD_AFTER": 5000,
+}
+
+AUTOCOMPLETE = {
+    # memory: sorted names in every process, database: text_pattern_ops indexes
+    "BACKEND": load_env("AUTOCOMPLETE_BACKEND", str, "memory"),
+    "DEFAULT_LIMIT": 5,
+    "MAX_LIMIT": 20,
+}
+
+# Concurrent identical service list requests share one computation
+SINGLE_FLIGHT = {
+    "ENABLED": True,
+    # seconds a request waits for the in-flight one before querying by itself
+    "TIMEOUT": 10,
+    # seconds between two logs of the counters of every worker, None disables
+    "STATS_INTERVAL": 60,
+}
+
+# Server side prepared statements of the hot services list filter
+# combinations, see gigflow.prepared. Statements are prepared per connection:
+# they need DATABASE_CONN_MAX_AGE and do not work behind a pool in
+# transaction mode.
+PREPARED_STATEMENTS = {
+    "ENABLED": load_env("PREPARED_STATEMENTS", bool, False),
+    # requests of a filter combination before it gets prepared
+    "HOT_AFTER": 3,
+    # least recently used statements are deallocated past this number
+    "MAX_PER_CONNECTION": 32,
+}
+
+# On demand profiling of single requests, see gigflow.profiling
+PROFILING = {
+    "ENABLED": load_env("PROFILING", bool, False),
+    # url names that can be profiled
+    "URL_NAMES": ["services", "service_types"],
+    # the X-Profile header works too
+    "QUERY_PARAM": "profile",
+    # callers allowed to download profiles, by address or X-Profile-Token header
+    "TRUSTED_IPS": ["127.0.0.1"],
+    "TOKEN": load_env("PROFILING_TOKEN", str),
+    # directory where profiles are stored, None disables storing
+    "OUTPUT_DIR": load_env("PROFILING_OUTPUT_DIR", str),
+    # profile 1 in SAMPLE_RATE requests of every endpoint, 0 disables sampling
+    "SAMPLE_RATE": load_env("PROFILING_SAMPLE_RATE", int, 0),
+    "SAMPLE_FORMAT": "collapsed",
+}
+
+# Capture of slow queries with their plan, see gigflow.slow_queries
+SLOW_QUERIES = {
+    "ENABLED": load_env("SLOW_QUERIES", bool, False),
+    "DATABASES": ["default"],
+    "THRESHOLD_MS": load_env("SLOW_QUERIES_THRESHOLD_MS", float, 200),
+    # capture the EXPLAIN plan of SELECT queries
+    "EXPLAIN": True,
+    # run side effect free queries again with EXPLAIN (ANALYZE, BUFFERS), which
+    # doubles the cost of an already slow query
+    "ANALYZE": load_env("SLOW_QUERIES_ANALYZE", bool, False),
+    # seconds between two captures of the same query fingerprint
+    "RATE_LIMIT_SECONDS": 300,
+    # JSON lines file read by the slow_queries command, None only logs
+    "LOG_FILE": load_env("SLOW_QUERIES_LOG_FILE", str),
+}
+
+# Console logs of the gigflow modules, e.g. the single flight counters
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "gigflow": {
+            "handlers": ["console"],
+            "level": load_env("GIGFLOW_LOG_LEVEL", str, "INFO"),
+        },
+        "services": {
+            "handlers": ["console"],
+            "level": load_env("GIGFLOW_LOG_LEVEL", str, "INFO"),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# placeholder lists of IN clauses, whatever their length
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+# literals embedded in raw SQL
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+# savepoints of the atomic blocks, named after the thread and a counter
+SAVEPOINT_NAME = re.compile(r'"s\d+_x\d+"')
+WHITESPACE = re.compile(r"\s+")
+# statements running them again would repeat their side effects or locks
+SIDE_EFFECTS = re.compile(
+    r"\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY)\b"
+    r"|\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE)\b|\bFOR\s+KEY\s+SHARE\b"
+    r"|\b(?:pg_notify|nextval|setval|set_config|pg_advisory_\w+|pg_sleep)\s*\(",
+    re.IGNORECASE,
+)
+# prepared statements of gigflow.prepared, all of them reads
+PREPARED_READ = re.compile(r"EXECUTE\s+gigflow_\w+", re.IGNORECASE)
+
+
+def normalize(sql: str) -> str:
+    """reduce a query to its shape, without literals or list lengths"""
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = SAVEPOINT_NAME.sub('"?"', sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = WHITESPACE.sub(" ", sql).strip()
+    return IN_LIST.sub("IN (...)", sql).replace("%s", "?")
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    """Rate limited log of the slow queries
+
+    Every fingerprint is captured at most once per ``RATE_LIMIT_SECONDS``, the
+    next capture records how many were skipped in between. Captures are
+    written to the ``gigflow.slow_queries`` logger and appended as JSON lines
+    to ``LOG_FILE``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._captured: Dict[str, float] = {}
+        self._skipped: Dict[str, int] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._captured.clear()
+            self._skipped.clear()
+
+    def acquire(self, key: str) -> Optional[int]:
+        """check if a fingerprint can be captured now
+
+        Returns:
+            Optional[int]: occurrences skipped since the last capture, None if
+                the fingerprint is rate limited
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._captured.get(key)
+            if last is not None and now - last < settings.SLOW_QUERIES["RATE_LIMIT_SECONDS"]:
+                self._skipped[key] = self._skipped.get(key, 0) + 1
+                return None
+            self._captured[key] = now
+            return self._skipped.pop(key, 0)
+
+    def write(self, record: dict) -> None:
+        logger.warning(
+            "slow query %s (%.1f ms) from %s: %s",
+            record["fingerprint"],
+            record["duration_ms"],
+            record["view"],
+            record["sql"],
+        )
+        log_file = settings.SLOW_QUERIES["LOG_FILE"]
+        if not log_file:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(log_file, "a") as file:
+            file.write(line)
+
+
+log = SlowQueryLog()
+
+
+class SlowQueryWrapper:
+    """Execute wrapper capturing the queries slower than the threshold"""
+
+    def __init__(self, view: str):
+        self.view = view
+
+    def __call__(self, execute: Callable, sql: str, params, many: bool, context: dict):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if not many and duration_ms >= settings.SLOW_QUERIES["THRESHOLD_MS"]:
+            self.capture(sql, params, duration_ms, context["connection"])
+        return result
+
+    def capture(self, sql: str, params, duration_ms: float, connection) -> None:
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        skipped = log.acquire(key)
+        if skipped is None:
+            return
+        log.write(
+            {
+                "time": timezone.now().isoformat(),
+                "fingerprint": key,
+                "sql": normalized,
+                "params": list(params or ()),
+                "duration_ms": round(duration_ms, 3),
+                "view": self.view,
+                "skipped": skipped,
+                "plan": self.explain(sql, params, connection),
+            }
+        )
+
+    def explain(self, sql: str, params, connection) -> Optional[str]:
+        """get the plan of a read query or of the execution of a prepared one
+
+        ``EXPLAIN (ANALYZE, BUFFERS)`` runs the query again, so it is only used
+        when ``ANALYZE`` is enabled and the query has no side effects nor takes
+        locks, e.g. ``pg_notify`` or ``FOR UPDATE``; the others get a plain
+        ``EXPLAIN``. The plan runs on the raw connection, so it does not go
+        through the execute wrappers again, inside a savepoint so a failure
+        does not break the current transaction.
+        """
+        config = settings.SLOW_QUERIES
+        if not config["EXPLAIN"]:
+            return None
+        statement = sql.lstrip()
+        if not statement.upper().startswith(("SELECT", "EXECUTE")):
+            return None
+        if statement.upper().startswith("EXECUTE"):
+            read = PREPARED_READ.match(statement) is not None
+        else:
+            read = SIDE_EFFECTS.search(STRING_LITERAL.sub("?", statement)) is None
+        explain = (
+            "EXPLAIN (ANALYZE, BUFFERS)" if config["ANALYZE"] and read else "EXPLAIN"
+        )
+        in_transaction = connection.in_atomic_block
+        with connection.connection.cursor() as cursor:
+            try:
+                if in_transaction:
+                    cursor.execute("SAVEPOINT slow_query_explain")
+                cursor.execute(f"{explain} {sql}", params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                if in_transaction:
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+                return plan
+            except connection.Database.Error as error:
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                return f"EXPLAIN failed: {error}"
+
+
+class SlowQueryMiddleware:
+    """Capture the slow queries run on the configured connections by a view
+
+    See ``SLOW_QUERIES`` in the settings.
+    """
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        config = settings.SLOW_QUERIES
+        if not config["ENABLED"]:
+            return self.get_response(request)
+        wrapper = SlowQueryWrapper(self._view(request))
+        with ExitStack() as stack:
+            for alias in config["DATABASES"]:
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            return self.get_response(request)
+
+    def _view(self, request: HttpRequest) -> str:
+        """name the view handling a request"""
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return f"{request.method} {request.path_info}"
+        view = getattr(match.func, "view_class", match.func)
+        return f"{request.method} {view.__module__}.{view.__qualname__}"
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gigflow.settings')
 
 application = get_wsgi_application()
+
+# every worker process listens for the cache invalidations of the others
+from services import autocomplete, invalidation  # noqa: E402
+
+invalidation.start()
+autocomplete.warm_up()
@@ -0,0 +1,97 @@
+# Python
+import datetime
+from typing import Callable, Optional
+
+# Django
+from django.db import connection, transaction
+
+# Models
+from services.models import services as services_models
+
+HOT_TABLE = services_models.Service._meta.db_table
+ARCHIVE_TABLE = services_models.ArchivedService._meta.db_table
+COLUMNS = ", ".join(
+    field.column for field in services_models.Service._meta.concrete_fields
+)
+
+
+def archive_batch(cutoff: datetime.datetime, batch_size: int) -> int:
+    """move one batch of services inactive since before a date to the archive
+
+    Every batch runs in its own transaction, so an interrupted run loses at
+    most the batch in progress and the next run continues from there.
+
+    Args:
+        cutoff (datetime.datetime): services updated after it stay in place
+        batch_size (int): maximum number of services to move
+    Returns:
+        int: number of archived services
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {HOT_TABLE} WHERE id IN (
+                    SELECT id FROM {HOT_TABLE}
+                    WHERE active = false AND updated_at < %s
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {COLUMNS}
+            )
+            INSERT INTO {ARCHIVE_TABLE} ({COLUMNS}, archived_at)
+            SELECT {COLUMNS}, now() FROM moved
+            """,
+            [cutoff, batch_size],
+        )
+        return cursor.rowcount
+
+
+def archive(
+    cutoff: datetime.datetime,
+    batch_size: int,
+    max_batches: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> int:
+    """archive services inactive since before a date in batches
+
+    Args:
+        cutoff (datetime.datetime): services updated after it stay in place
+        batch_size (int): maximum number of services moved per transaction
+        max_batches (Optional[int]): stop after this many batches
+        on_batch (Optional[Callable[[int], None]]): called with each batch size
+    Returns:
+        int: number of archived services
+    """
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        total += moved
+        batches += 1
+        if on_batch:
+            on_batch(moved)
+    return total
+
+
+def restore(service_id: int) -> bool:
+    """move an archived service back to the services table
+
+    Raises:
+        IntegrityError: another service took its title and service type
+    Returns:
+        bool: False if the service is not archived
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {ARCHIVE_TABLE} WHERE id = %s RETURNING {COLUMNS}
+            )
+            INSERT INTO {HOT_TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM moved
+            """,
+            [service_id],
+        )
+        return cursor.rowcount > 0
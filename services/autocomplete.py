@@ -0,0 +1,203 @@
+"""Prefix autocomplete of service titles and service type names
+
+Every process keeps the active names sorted in memory and answers a prefix
+with two binary searches, ranking the matches by recency. The invalidation
+bus marks the changed ids, which are read again before the next search;
+clearing it reloads the whole index in the background while the searches
+keep using the previous names. ``AUTOCOMPLETE["BACKEND"] =
+"database"`` answers from PostgreSQL instead, with a ``LIKE 'prefix%'``
+served by the ``text_pattern_ops`` indexes on ``UPPER(title)`` and
+``UPPER(name)``.
+"""
+
+# Python
+import bisect
+import heapq
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Model
+
+# Models
+from services.models import services as services_models
+
+from services import invalidation
+
+logger = logging.getLogger(__name__)
+
+# normalized text, id, text, rank
+Entry = Tuple[str, int, str, float]
+# sorts after any text starting with the prefix
+HIGHEST = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    return text.strip().lower()
+
+
+class PrefixIndex:
+    """Active names of a model sorted for prefix searches
+
+    Registered in the invalidation bus like a cache. Reloads read the names
+    outside of the lock and swap them in at once, only the first search of a
+    process waits for them.
+    """
+
+    def __init__(self, model: Model, field: str):
+        self.model = model
+        self.field = field
+        self._lock = threading.Lock()
+        self._entries: List[Entry] = []
+        self._by_id: Dict[int, Entry] = {}
+        self._dirty: Set[int] = set()
+        self._everything = True
+        self._loaded = False
+        self._reloading = threading.Lock()
+
+    def evict(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._everything = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _rows(
+        self, ids: Optional[Set[int]] = None
+    ) -> Iterable[Tuple[int, str, object]]:
+        queryset = self.model.objects.filter(active=True)
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        return queryset.values_list("id", self.field, "updated_at").iterator()
+
+    def _entry(self, id: int, text: str, updated_at) -> Entry:
+        return (normalize(text), id, text, updated_at.timestamp())
+
+    def _reload(self) -> None:
+        """read every name and swap them in, holding ``_reloading``
+
+        The changes received while reading are applied by the first search
+        after the swap, a failed query leaves the reload for the next search.
+        """
+        with self._lock:
+            self._everything = False
+            self._dirty.clear()
+        try:
+            entries = sorted(self._entry(*row) for row in self._rows())
+        except Exception:
+            with self._lock:
+                self._everything = True
+            raise
+        by_id = {entry[1]: entry for entry in entries}
+        with self._lock:
+            self._entries, self._by_id = entries, by_id
+            self._loaded = True
+
+    def reload(self) -> None:
+        """read every name again, waiting for the running reload"""
+        with self._reloading:
+            self._reload()
+
+    def reload_in_background(self) -> bool:
+        """read every name again in a thread
+
+        Returns:
+            bool: False if a reload is already running
+        """
+        if not self._reloading.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._reload()
+            except Exception:
+                logger.exception("%s autocomplete reload failed", self.model.__name__)
+            finally:
+                connection.close()
+                self._reloading.release()
+
+        threading.Thread(target=run, name="autocomplete-reload", daemon=True).start()
+        return True
+
+    def _sync(self) -> None:
+        """apply the changed ids received since the last search, holding the lock
+
+        Skipped while reloading, the reload may have read the rows before
+        the change. The changes are only forgotten once their rows were
+        read, a failed query leaves them for the next search.
+        """
+        if not self._dirty or self._reloading.locked():
+            return
+        rows = list(self._rows(self._dirty))
+        for id in self._dirty:
+            entry = self._by_id.pop(id, None)
+            if entry is not None:
+                del self._entries[bisect.bisect_left(self._entries, entry)]
+        for row in rows:
+            entry = self._entry(*row)
+            bisect.insort(self._entries, entry)
+            self._by_id[entry[1]] = entry
+        self._dirty.clear()
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        """most recent names starting with a prefix, case insensitive
+
+        Returns:
+            List[Tuple[int, str]]: ids and names
+        """
+        prefix = normalize(prefix)
+        if not self._loaded:
+            with self._reloading:
+                if not self._loaded:
+                    self._reload()
+        elif self._everything:
+            self.reload_in_background()
+        with self._lock:
+            self._sync()
+            start = bisect.bisect_left(self._entries, (prefix,))
+            end = bisect.bisect_left(self._entries, (prefix + HIGHEST,), lo=start)
+            matches = self._entries[start:end]
+        if len(matches) > limit:
+            matches = heapq.nlargest(limit, matches, key=lambda entry: entry[3])
+        matches.sort(key=lambda entry: (-entry[3], entry[0]))
+        return [(id, text) for _, id, text, _ in matches]
+
+
+def search_database(
+    model: Model, field: str, prefix: str, limit: int
+) -> List[Tuple[int, str]]:
+    """most recent names starting with a prefix, from the prefix indexes"""
+    return list(
+        model.objects.filter(active=True, **{f"{field}__istartswith": prefix.strip()})
+        .order_by("-updated_at")
+        .values_list("id", field)[:limit]
+    )
+
+
+services = invalidation.register(
+    PrefixIndex(services_models.Service, "title"), "services.service"
+)
+service_types = invalidation.register(
+    PrefixIndex(services_models.ServiceType, "name"), "services.servicetype"
+)
+
+
+def warm_up() -> None:
+    """load the names of the memory backend in the background, at startup"""
+    if settings.AUTOCOMPLETE["BACKEND"] != "database":
+        services.reload_in_background()
+        service_types.reload_in_background()
+
+
+def search(index: PrefixIndex, prefix: str, limit: int) -> List[Tuple[int, str]]:
+    """search names in the configured backend"""
+    if settings.AUTOCOMPLETE["BACKEND"] == "database":
+        return search_database(index.model, index.field, prefix, limit)
+    return index.search(prefix, limit)
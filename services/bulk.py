@@ -0,0 +1,313 @@
+"""Bulk import and export of service types and services with COPY
+
+Files hold one row per service type or service, with the service type of a
+service referenced by name so snapshots can be loaded in another database:
+
+- service types: ``name, active, created_at, updated_at``
+- services: ``title, description, price, tasks, service_type, active,
+  created_at, updated_at``, tasks as a JSON list
+
+Files are CSV with a header or PostgreSQL's binary COPY format, streamed
+through ``COPY ... TO STDOUT`` / ``FROM STDIN`` so memory stays constant
+whatever their size. Imports load a temporary staging table and upsert from
+it: service types on their name, services on ``(title, service_type)``.
+Empty ``active`` or ``created_at`` take the model defaults. Imported rows
+are marked as updated at the import, unless ``keep_timestamps`` keeps the
+``updated_at`` of the file.
+"""
+# Python
+from typing import BinaryIO, List, Tuple
+
+# Django
+from django.db import connection
+
+# Models
+from services.models import services as services_models
+
+from services import partitions
+
+FORMATS = ("csv", "binary")
+
+SERVICE_TYPES_TABLE = services_models.ServiceType._meta.db_table
+SERVICES_TABLE = services_models.Service._meta.db_table
+
+SERVICE_TYPE_COLUMNS = ("name", "active", "created_at", "updated_at")
+SERVICE_COLUMNS = (
+    "title",
+    "description",
+    "price",
+    "tasks",
+    "service_type",
+    "active",
+    "created_at",
+    "updated_at",
+)
+
+
+def copy_options(format: str) -> str:
+    if format not in FORMATS:
+        raise ValueError(
+            f"unknown format {format}, expected one of {', '.join(FORMATS)}"
+        )
+    return "(FORMAT csv, HEADER true)" if format == "csv" else "(FORMAT binary)"
+
+
+def _db_type(model, column: str) -> str:
+    if model is services_models.Service and column == "service_type":
+        model, column = services_models.ServiceType, "name"
+    return model._meta.get_field(column).db_type(connection)
+
+
+def _staging(cursor, name: str, model, columns: Tuple[str, ...]) -> None:
+    """create a temporary table with the columns of a file, typed like the
+    model so invalid values fail while copying with their line number"""
+    definition = ", ".join(f"{column} {_db_type(model, column)}" for column in columns)
+    # a previous import of the same transaction left it behind
+    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {name} (line bigserial, {definition}) ON COMMIT DROP"
+    )
+
+
+def _copy_in(
+    cursor, table: str, columns: Tuple[str, ...], file: BinaryIO, format: str
+) -> int:
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH {copy_options(format)}",
+        file,
+    )
+    rows = cursor.rowcount
+    cursor.execute(f"ANALYZE {table}")
+    return rows
+
+
+def _lines(format: str, lines: List[int]) -> str:
+    """file lines of staging rows, counted like the COPY errors"""
+    offset = 1 if format == "csv" else 0  # the csv header
+    numbers = ", ".join(str(line + offset) for line in lines)
+    return f"line {numbers}" if len(lines) == 1 else f"lines {numbers}"
+
+
+def export_service_types(file: BinaryIO, format: str) -> int:
+    """write every service type to a file
+
+    Returns:
+        int: number of exported rows
+    """
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"""
+            COPY (
+                SELECT {', '.join(SERVICE_TYPE_COLUMNS)} FROM {SERVICE_TYPES_TABLE}
+                ORDER BY id
+            ) TO STDOUT WITH {copy_options(format)}
+            """,
+            file,
+        )
+        return cursor.rowcount
+
+
+def export_services(file: BinaryIO, format: str) -> int:
+    """write every service to a file, with the name of its service type
+
+    Returns:
+        int: number of exported rows
+    """
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"""
+            COPY (
+                SELECT
+                    s.title, s.description, s.price, s.tasks, t.name AS service_type,
+                    s.active, s.created_at, s.updated_at
+                FROM {SERVICES_TABLE} s
+                JOIN {SERVICE_TYPES_TABLE} t ON t.id = s.service_type_id
+                ORDER BY s.id
+            ) TO STDOUT WITH {copy_options(format)}
+            """,
+            file,
+        )
+        return cursor.rowcount
+
+
+def import_service_types(
+    file: BinaryIO, format: str, keep_timestamps: bool = False
+) -> Tuple[int, int, int]:
+    """upsert the service types of a file on their name
+
+    Must run inside a transaction. The services of updated service types lose
+    their document, which nests the service type.
+
+    Args:
+        file (BinaryIO): file to read
+        format (str): one of ``FORMATS``
+        keep_timestamps (bool): keep the ``updated_at`` of the file instead of
+            the time of the import
+
+    Returns:
+        Tuple[int, int, int]: read rows, inserted and updated service types
+    """
+    with connection.cursor() as cursor:
+        _staging(
+            cursor,
+            "service_types_import",
+            services_models.ServiceType,
+            SERVICE_TYPE_COLUMNS,
+        )
+        rows = _copy_in(
+            cursor, "service_types_import", SERVICE_TYPE_COLUMNS, file, format
+        )
+        cursor.execute(
+            f"""
+            WITH upserted AS (
+                INSERT INTO {SERVICE_TYPES_TABLE} (name, active, created_at, updated_at)
+                SELECT DISTINCT ON (name)
+                    name,
+                    COALESCE(active, true),
+                    COALESCE(created_at, now()),
+                    {"COALESCE(updated_at, now())" if keep_timestamps else "now()"}
+                FROM service_types_import
+                ORDER BY name, line DESC
+                ON CONFLICT (name) DO UPDATE SET
+                    active = EXCLUDED.active,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING id, xmax = 0 AS inserted
+            ), cleared AS (
+                UPDATE {SERVICES_TABLE} SET document = NULL
+                WHERE service_type_id IN (SELECT id FROM upserted WHERE NOT inserted)
+                AND document IS NOT NULL
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+            FROM upserted
+            """
+        )
+        return (rows, *cursor.fetchone())
+
+
+def import_services(
+    file: BinaryIO, format: str, keep_timestamps: bool = False
+) -> Tuple[int, int, int]:
+    """upsert the services of a file on their title and service type
+
+    Must run inside a transaction. Upserted services lose their document until
+    it is rebuilt.
+
+    Args:
+        file (BinaryIO): file to read
+        format (str): one of ``FORMATS``
+        keep_timestamps (bool): keep the ``updated_at`` of the file instead of
+            the time of the import
+    Returns:
+        Tuple[int, int, int]: read rows, inserted and updated services
+    Raises:
+        ValueError: some service type of the file does not exist or some tasks
+            are not a list of strings
+    """
+    with connection.cursor() as cursor:
+        _staging(cursor, "services_import", services_models.Service, SERVICE_COLUMNS)
+        rows = _copy_in(cursor, "services_import", SERVICE_COLUMNS, file, format)
+        cursor.execute(
+            f"""
+            SELECT DISTINCT service_type FROM services_import i
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {SERVICE_TYPES_TABLE} t WHERE t.name = i.service_type
+            )
+            ORDER BY service_type LIMIT 20
+            """
+        )
+        missing: List[str] = [row[0] for row in cursor.fetchall()]
+        if missing:
+            raise ValueError(f"unknown service types: {', '.join(map(str, missing))}")
+
+        # jsonb only checks the syntax, the tasks must be a list of strings
+        cursor.execute(
+            """
+            SELECT line FROM services_import
+            WHERE CASE
+                WHEN jsonb_typeof(tasks) <> 'array' THEN true
+                ELSE EXISTS (
+                    SELECT 1 FROM jsonb_array_elements(tasks) task
+                    WHERE jsonb_typeof(task) <> 'string'
+                )
+            END
+            ORDER BY line LIMIT 20
+            """
+        )
+        invalid = [row[0] for row in cursor.fetchall()]
+        if invalid:
+            raise ValueError(
+                f"tasks must be a list of strings on {_lines(format, invalid)}"
+            )
+
+        # the last line of every (title, service type) wins
+        cursor.execute("DROP TABLE IF EXISTS services_import_rows")
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE services_import_rows ON COMMIT DROP AS
+            SELECT DISTINCT ON (i.title, t.id)
+                i.title,
+                COALESCE(i.description, '') AS description,
+                i.price,
+                COALESCE(i.tasks, '[]') AS tasks,
+                t.id AS service_type_id,
+                COALESCE(i.active, true) AS active,
+                COALESCE(i.created_at, now()) AS created_at,
+                {"COALESCE(i.updated_at, now())" if keep_timestamps else "now()"}
+                    AS updated_at
+            FROM services_import i
+            JOIN {SERVICE_TYPES_TABLE} t ON t.name = i.service_type
+            ORDER BY i.title, t.id, i.line DESC
+            """
+        )
+        cursor.execute("ANALYZE services_import_rows")
+        columns = (
+            "title, description, price, tasks, service_type_id, active, created_at, updated_at"
+        )
+        if partitions.is_partitioned():
+            # partitioned services have no unique constraint for ON CONFLICT,
+            # their unique keys are kept by a trigger, see services.partitions
+            cursor.execute(
+                f"""
+                UPDATE {SERVICES_TABLE} s SET
+                    description = r.description,
+                    price = r.price,
+                    tasks = r.tasks,
+                    active = r.active,
+                    updated_at = r.updated_at,
+                    document = NULL
+                FROM services_import_rows r
+                WHERE s.title = r.title AND s.service_type_id = r.service_type_id
+                """
+            )
+            updated = cursor.rowcount
+            cursor.execute(
+                f"""
+                INSERT INTO {SERVICES_TABLE} ({columns})
+                SELECT {columns} FROM services_import_rows r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {SERVICES_TABLE} s
+                    WHERE s.title = r.title AND s.service_type_id = r.service_type_id
+                )
+                """
+            )
+            return rows, cursor.rowcount, updated
+
+        cursor.execute(
+            f"""
+            WITH upserted AS (
+                INSERT INTO {SERVICES_TABLE} ({columns})
+                SELECT {columns} FROM services_import_rows
+                ON CONFLICT (title, service_type_id) DO UPDATE SET
+                    description = EXCLUDED.description,
+                    price = EXCLUDED.price,
+                    tasks = EXCLUDED.tasks,
+                    active = EXCLUDED.active,
+                    updated_at = EXCLUDED.updated_at,
+                    document = NULL
+                RETURNING xmax = 0 AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+            FROM upserted
+            """
+        )
+        return (rows, *cursor.fetchone())
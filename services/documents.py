@@ -0,0 +1,115 @@
+"""Precomputed service documents
+
+Every service stores the output of ``ServiceSerializer`` in its ``document``
+column, so list and detail reads return the stored documents instead of
+serializing rows again. Documents are refreshed when a service is saved or its
+service type changes. Writes that skip model signals (``QuerySet.update``,
+``bulk_create``, raw SQL) leave them stale or empty until
+``rebuild_service_documents`` runs; empty documents are serialized on read.
+"""
+# Python
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Django
+from django.db import connection
+from django.db.models import QuerySet
+
+# Models
+from services.models import services as services_models
+
+# Serializers
+from services.serializers import services as services_serializers
+
+
+def build(service: services_models.Service) -> dict:
+    """serialize a service the same way the views do"""
+    return services_serializers.ServiceSerializer(service).data
+
+
+def refresh(service: services_models.Service) -> None:
+    """store the document of a saved service"""
+    services_models.Service.objects.filter(id=service.id).update(
+        document=build(service)
+    )
+
+
+def refresh_service_type(service_type: services_models.ServiceType) -> int:
+    """replace the nested service type in the documents of its services
+
+    Returns:
+        int: number of updated documents
+    """
+    data = services_serializers.ServiceTypeSerializer(service_type).data
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {services_models.Service._meta.db_table}
+            SET document = jsonb_set(document, '{{service_type}}', %s::jsonb)
+            WHERE service_type_id = %s AND document IS NOT NULL
+            """,
+            [json.dumps(data), service_type.id],
+        )
+        return cursor.rowcount
+
+
+def render(rows: Iterable[Tuple[int, Optional[dict]]]) -> List[dict]:
+    """get the documents of (id, document) rows keeping their order
+
+    Rows without a document are serialized with one extra query.
+    """
+    rows = list(rows)
+    missing = [id for id, document in rows if document is None]
+    services = {}
+    if missing:
+        services = services_models.Service.objects.select_related(
+            "service_type"
+        ).in_bulk(missing)
+    return [
+        document if document is not None else build(services[id])
+        for id, document in rows
+    ]
+
+
+def _batches(queryset: QuerySet, batch_size: int) -> Iterator[list]:
+    batch = []
+    for service in queryset.select_related("service_type").order_by("id").iterator(
+        chunk_size=batch_size
+    ):
+        batch.append(service)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild(queryset: QuerySet, batch_size: int = 1000) -> int:
+    """rebuild the documents of a queryset of services
+
+    Returns:
+        int: number of rebuilt documents
+    """
+    total = 0
+    for batch in _batches(queryset, batch_size):
+        for service in batch:
+            service.document = build(service)
+        services_models.Service.objects.bulk_update(batch, ["document"])
+        total += len(batch)
+    return total
+
+
+def check(queryset: QuerySet, batch_size: int = 1000) -> List[int]:
+    """compare the stored documents with the serializer output
+
+    Returns:
+        List[int]: ids of the services with a missing or stale document
+    """
+    stale = []
+    for batch in _batches(queryset, batch_size):
+        stale += [
+            service.id
+            for service in batch
+            if service.document is None or service.document != build(service)
+        ]
+    return stale
@@ -0,0 +1,331 @@
+"""Cross-worker invalidation of in-process caches
+
+Every gunicorn worker keeps its own local caches, so a write in one worker
+must evict the matching entries in the others. Writes publish the changed
+model and ids, each worker runs a ``Listener`` thread that receives them and
+evicts the registered caches.
+
+Two transports only need the existing PostgreSQL database:
+
+- ``notify``: ``pg_notify`` on a channel, delivered when the writing
+  transaction commits, received with ``LISTEN``.
+- ``poll``: rows appended to ``cache_invalidations``, read every
+  ``POLL_INTERVAL`` seconds, for setups where ``LISTEN`` is not available
+  (e.g. transaction pooling).
+"""
+# Python
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Django
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+# Models
+from services.models import invalidations as invalidations_models
+
+logger = logging.getLogger(__name__)
+
+# pg_notify payloads must stay under 8000 bytes, bigger changes evict everything
+MAX_PAYLOAD = 7500
+# skipped cache_invalidations ids followed at once by the poll mode
+MAX_GAPS = 1000
+
+
+class LocalCache:
+    """Thread safe in-process LRU cache with a time to live"""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# model label -> caches and if they evict the changed ids or everything
+_registry: Dict[str, List[Tuple[LocalCache, bool]]] = {}
+_stats = {"published": 0, "received": 0, "lag_ms_last": 0.0, "lag_ms_max": 0.0, "reconnects": 0}
+_stats_lock = threading.Lock()
+
+
+def register(cache: LocalCache, model: str, evict_all: bool = False) -> LocalCache:
+    """evict a cache on the changes of a model
+
+    Args:
+        cache (LocalCache): cache keyed by the ids of the model
+        model (str): model label, e.g. ``services.service``
+        evict_all (bool): clear the whole cache instead of the changed ids
+    """
+    _registry.setdefault(model, []).append((cache, evict_all))
+    return cache
+
+
+def stats() -> dict:
+    """counters of published and received changes and delivery lag"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def dispatch(payload: dict) -> None:
+    """evict the registered caches of a change"""
+    for cache, evict_all in _registry.get(payload["model"], []):
+        if evict_all or payload["ids"] is None:
+            cache.clear()
+        else:
+            cache.evict(payload["ids"])
+
+
+def clear_all() -> None:
+    for caches in _registry.values():
+        for cache, _ in caches:
+            cache.clear()
+
+
+def publish(model: str, ids: Optional[Iterable[int]] = None) -> None:
+    """announce a change to every worker
+
+    The local caches are evicted right away and again once the transaction
+    commits, the other workers receive the change after the commit.
+
+    Args:
+        model (str): model label, e.g. ``services.service``
+        ids (Optional[Iterable[int]]): changed ids, None for any
+    """
+    payload = {
+        "model": model,
+        "ids": None if ids is None else list(ids),
+        "sent_at": time.time(),
+        "pid": os.getpid(),
+    }
+    message = json.dumps(payload)
+    if len(message) > MAX_PAYLOAD:
+        payload["ids"] = None
+        message = json.dumps(payload)
+
+    dispatch(payload)
+    transaction.on_commit(lambda: dispatch(payload))
+    with _stats_lock:
+        _stats["published"] += 1
+
+    config = settings.CACHE_INVALIDATION
+    if not config["ENABLED"]:
+        return
+    if config["MODE"] == "poll":
+        invalidations_models.CacheInvalidation.objects.create(payload=payload)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [config["CHANNEL"], message])
+
+
+def _received(payload: dict) -> None:
+    lag_ms = max(0.0, (time.time() - payload["sent_at"]) * 1000)
+    with _stats_lock:
+        _stats["received"] += 1
+        _stats["lag_ms_last"] = lag_ms
+        _stats["lag_ms_max"] = max(_stats["lag_ms_max"], lag_ms)
+    dispatch(payload)
+
+
+class Listener:
+    """Receive the published changes on a dedicated connection
+
+    The counters of ``stats`` are logged at most every ``stats_interval``
+    seconds.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        channel: str,
+        poll_interval: float,
+        retention: float,
+        gap_timeout: float = 300,
+        stats_interval: Optional[float] = None,
+    ):
+        self.mode = mode
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.gap_timeout = gap_timeout
+        self.stats_interval = stats_interval
+        self.connection = None
+        self.last_id = 0
+        # ids below last_id not read yet and when they were skipped
+        self.gaps: Dict[int, float] = {}
+        self._pruned_at = 0.0
+        self._logged_at = time.monotonic()
+        self._stop = threading.Event()
+
+    def connect(self) -> None:
+        """open the listening connection, outside of django's connection handling"""
+        wrapper = connections["default"]
+        self.connection = wrapper.Database.connect(**wrapper.get_connection_params())
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            if self.mode == "poll":
+                cursor.execute(
+                    f"SELECT COALESCE(max(id), 0) FROM "
+                    f"{invalidations_models.CacheInvalidation._meta.db_table}"
+                )
+                self.last_id = cursor.fetchone()[0]
+            else:
+                cursor.execute(f'LISTEN "{self.channel}"')
+
+    def poll(self, timeout: float) -> int:
+        """wait up to a timeout for changes and dispatch them
+
+        Returns:
+            int: number of received changes
+        """
+        if self.mode == "poll":
+            return self._poll_table(timeout)
+        if select.select([self.connection], [], [], timeout) == ([], [], []):
+            return 0
+        self.connection.poll()
+        received = 0
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            _received(json.loads(notify.payload))
+            received += 1
+        return received
+
+    def _poll_table(self, timeout: float) -> int:
+        """read the rows after the last one and the skipped ones
+
+        Ids are taken when a row is inserted but rows become visible when
+        their transaction commits, so a row may appear after a higher id was
+        read. Skipped ids are read again until they show up or ``gap_timeout``
+        seconds pass, rolled back transactions leave gaps that never fill.
+        """
+        table = invalidations_models.CacheInvalidation._meta.db_table
+        now = time.monotonic()
+        self.gaps = {
+            id: skipped_at
+            for id, skipped_at in self.gaps.items()
+            if now - skipped_at < self.gap_timeout
+        }
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, payload FROM {table} "
+                "WHERE id > %s OR id = ANY(%s) ORDER BY id",
+                [self.last_id, list(self.gaps)],
+            )
+            rows = cursor.fetchall()
+            for id, payload in rows:
+                _received(payload)
+                if id < self.last_id:
+                    self.gaps.pop(id, None)
+                    continue
+                for gap in range(max(self.last_id + 1, id - MAX_GAPS), id):
+                    self.gaps[gap] = now
+                self.last_id = id
+            if time.monotonic() - self._pruned_at > 60:
+                cursor.execute(
+                    f"DELETE FROM {table} "
+                    "WHERE created_at < now() - %s * interval '1 second'",
+                    [self.retention],
+                )
+                self._pruned_at = time.monotonic()
+        if not rows:
+            self._stop.wait(timeout)
+        return len(rows)
+
+    def run(self) -> None:
+        """receive changes until stopped, reconnecting after errors
+
+        Changes sent while disconnected are lost, so every registered cache is
+        cleared after reconnecting.
+        """
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                if self.connection is None:
+                    self.connect()
+                    clear_all()
+                self.poll(self.poll_interval)
+                backoff = 1
+                self.log_stats()
+            except Exception:
+                logger.exception("invalidation listener failed, reconnecting")
+                with _stats_lock:
+                    _stats["reconnects"] += 1
+                self.close()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+        self.close()
+
+    def log_stats(self) -> None:
+        """log the counters if ``stats_interval`` seconds passed since the last time"""
+        now = time.monotonic()
+        if self.stats_interval is None or now - self._logged_at < self.stats_interval:
+            return
+        self._logged_at = now
+        logger.info("invalidation %s: %s", self.mode, stats())
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def close(self) -> None:
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            finally:
+                self.connection = None
+
+
+_listener: Optional[Listener] = None
+
+
+def start() -> Optional[Listener]:
+    """start the listener thread of this process, once"""
+    global _listener
+    config = settings.CACHE_INVALIDATION
+    if not config["ENABLED"] or _listener is not None:
+        return _listener
+    _listener = Listener(
+        config["MODE"],
+        config["CHANNEL"],
+        config["POLL_INTERVAL"],
+        config["RETENTION_SECONDS"],
+        config["GAP_SECONDS"],
+        config["STATS_INTERVAL"],
+    )
+    threading.Thread(target=_listener.run, name="cache-invalidation", daemon=True).start()
+    return _listener
@@ -0,0 +1,59 @@
+# Python
+import datetime
+import time
+
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from services import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move services inactive for a long time to the archive table, in "
+        "batches that can be interrupted and resumed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--inactive-days",
+            type=int,
+            default=settings.SERVICES_ARCHIVE["INACTIVE_DAYS"],
+            help="days a service must stay inactive before being archived",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.SERVICES_ARCHIVE["BATCH_SIZE"],
+            help="services moved per transaction",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="stop after this many batches",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="seconds to wait between batches",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options["inactive_days"])
+
+        def on_batch(moved: int) -> None:
+            self.stdout.write(f"archived {moved} services")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        total = archive.archive(
+            cutoff,
+            options["batch_size"],
+            max_batches=options["max_batches"],
+            on_batch=on_batch,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{total} services archived"))
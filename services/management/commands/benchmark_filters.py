@@ -0,0 +1,101 @@
+# Python
+import statistics
+import time
+from urllib.parse import parse_qsl
+
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+# Views
+from services.views import services as services_views
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare services list requests answered by django with the ones "
+        "answered by prepared statements, through ServiceView and closing or "
+        "reusing the connection after every request like the WSGI server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filters",
+            default="active=true&title=a&minimum_price=10&start_date=2020-01-01",
+            help="query string of the list filters",
+        )
+        parser.add_argument("--iterations", type=int, default=500)
+        parser.add_argument("--page-size", type=int, default=5)
+        parser.add_argument(
+            "--conn-max-age",
+            type=int,
+            default=None,
+            help="CONN_MAX_AGE of the run, the configured one by default",
+        )
+
+    def handle(self, *args, **options):
+        params = dict(parse_qsl(options["filters"]), page_size=options["page_size"])
+        conn_max_age = options["conn_max_age"]
+        if conn_max_age is None:
+            conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        configured = connection.settings_dict["CONN_MAX_AGE"]
+        connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+        try:
+            timings, responses = {}, {}
+            for name, enabled in (("django", False), ("prepared", True)):
+                with override_settings(
+                    PREPARED_STATEMENTS=dict(
+                        settings.PREPARED_STATEMENTS, ENABLED=enabled, HOT_AFTER=1
+                    ),
+                    SINGLE_FLIGHT=dict(settings.SINGLE_FLIGHT, ENABLED=False),
+                ):
+                    services_views.services_list_statements.reset()
+                    responses[name] = self._request(params)
+                    if responses[name].status_code != 200:
+                        raise CommandError(f"invalid filters: {responses[name].data}")
+                    timings[name] = self._time(params, options["iterations"])
+                    stats = services_views.services_list_statements.stats()
+        finally:
+            connection.settings_dict["CONN_MAX_AGE"] = configured
+            connection.close()
+
+        if responses["django"].data != responses["prepared"].data:
+            raise CommandError("prepared statement results differ from django")
+
+        self.stdout.write(
+            f"{options['iterations']} list requests with {options['filters']}, "
+            f"CONN_MAX_AGE={conn_max_age}"
+        )
+        for name, samples in timings.items():
+            self.stdout.write(
+                f"{name:<10} mean {statistics.mean(samples):.3f} ms  "
+                f"p50 {statistics.median(samples):.3f} ms  "
+                f"p95 {self._percentile(samples, 95):.3f} ms"
+            )
+        if not stats["prepared"]:
+            self.stdout.write(
+                self.style.WARNING("nothing was prepared, see PREPARED_STATEMENTS")
+            )
+        saved = statistics.mean(timings["django"]) - statistics.mean(timings["prepared"])
+        self.stdout.write(self.style.SUCCESS(f"{saved:.3f} ms saved per request"))
+
+    def _request(self, params: dict):
+        """request the list and handle the connection like the end of a request"""
+        response = Client().get(reverse("services"), params)
+        close_old_connections()
+        return response
+
+    def _time(self, params: dict, iterations: int) -> list:
+        """request the list once per iteration, in milliseconds"""
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            self._request(params)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
+
+    def _percentile(self, samples: list, percentile: int) -> float:
+        return sorted(samples)[min(len(samples) - 1, len(samples) * percentile // 100)]
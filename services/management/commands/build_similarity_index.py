@@ -0,0 +1,32 @@
+# Python
+import time
+from pathlib import Path
+
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services import similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the TF-IDF index of the similar services endpoint and make it "
+        "the current one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = similarity.build(
+            Path(settings.SIMILARITY_INDEX["DIRECTORY"]), options["batch_size"]
+        )
+        index = similarity.Index(path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(index)} services indexed in {path} "
+                f"({time.perf_counter() - start:.2f} s)"
+            )
+        )
@@ -0,0 +1,46 @@
+# Python
+import sys
+import time
+
+# Django
+from django.core.management.base import BaseCommand
+
+from services import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Export services, or service types, to a CSV or binary file with "
+        "COPY TO STDOUT"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="output file, - for stdout")
+        parser.add_argument("--format", choices=bulk.FORMATS, default="csv")
+        parser.add_argument(
+            "--service-types",
+            action="store_true",
+            help="export the service types instead of the services",
+        )
+
+    def handle(self, *args, **options):
+        export = (
+            bulk.export_service_types if options["service_types"] else bulk.export_services
+        )
+        start = time.perf_counter()
+        if options["file"] == "-":
+            rows = export(sys.stdout.buffer, options["format"])
+            sys.stdout.buffer.flush()
+            # keep stdout for the data
+            output = self.stderr
+        else:
+            with open(options["file"], "wb") as file:
+                rows = export(file, options["format"])
+            output = self.stdout
+        elapsed = time.perf_counter() - start
+        output.write(
+            self.style.SUCCESS(
+                f"{rows} rows exported in {elapsed:.2f} s "
+                f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
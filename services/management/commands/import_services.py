@@ -0,0 +1,88 @@
+# Python
+import sys
+import time
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+# Models
+from services.models import services as services_models
+
+from services import bulk, documents, invalidation
+
+
+class Command(BaseCommand):
+    help = (
+        "Import services, or service types, from a CSV or binary file with "
+        "COPY FROM STDIN, upserting services on their title and service type"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="input file, - for stdin")
+        parser.add_argument("--format", choices=bulk.FORMATS, default="csv")
+        parser.add_argument(
+            "--service-types",
+            action="store_true",
+            help="import service types instead of services",
+        )
+        parser.add_argument(
+            "--skip-documents",
+            action="store_true",
+            help=(
+                "leave the documents of the imported services empty, for "
+                "rebuild_service_documents --missing"
+            ),
+        )
+        parser.add_argument(
+            "--keep-timestamps",
+            action="store_true",
+            help=(
+                "keep the updated_at of the file instead of marking the rows as "
+                "updated now"
+            ),
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        load = (
+            bulk.import_service_types if options["service_types"] else bulk.import_services
+        )
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if options["file"] == "-":
+                    rows, inserted, updated = load(
+                        sys.stdin.buffer, options["format"], options["keep_timestamps"]
+                    )
+                else:
+                    with open(options["file"], "rb") as file:
+                        rows, inserted, updated = load(
+                            file, options["format"], options["keep_timestamps"]
+                        )
+                # every cached service may have changed
+                invalidation.publish("services.service")
+                if options["service_types"]:
+                    invalidation.publish("services.servicetype")
+        # COPY runs on the psycopg2 cursor, its errors are not wrapped by django
+        except (ValueError, DatabaseError, connection.Database.Error) as error:
+            raise CommandError(f"import failed: {error}")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{rows} rows read in {elapsed:.2f} s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s), "
+            f"{inserted} inserted, {updated} updated"
+        )
+
+        if not options["skip_documents"]:
+            start = time.perf_counter()
+            rebuilt = documents.rebuild(
+                services_models.Service.objects.filter(document__isnull=True),
+                options["batch_size"],
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{rebuilt} documents rebuilt in {elapsed:.2f} s "
+                f"({rebuilt / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{inserted + updated} rows imported"))
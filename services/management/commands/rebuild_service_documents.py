@@ -0,0 +1,44 @@
+# Django
+from django.core.management.base import BaseCommand, CommandError
+
+# Models
+from services.models import services as services_models
+
+from services import documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the precomputed documents of the services, or check that they "
+        "match the serializer output"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="only report missing or stale documents",
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="only rebuild the services without a document",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = services_models.Service.objects.all()
+        if options["missing"]:
+            queryset = queryset.filter(document__isnull=True)
+
+        if options["check"]:
+            stale = documents.check(queryset, options["batch_size"])
+            if stale:
+                raise CommandError(
+                    f"{len(stale)} stale documents: {', '.join(map(str, stale[:20]))}"
+                )
+            self.stdout.write(self.style.SUCCESS("documents are up to date"))
+            return
+
+        total = documents.rebuild(queryset, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{total} documents rebuilt"))
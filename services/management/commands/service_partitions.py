@@ -0,0 +1,83 @@
+# Python
+import datetime
+
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from services import invalidation, partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-create the monthly partitions of the services table and detach "
+        "the ones older than the retention window"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.SERVICES_PARTITIONING["MONTHS_AHEAD"],
+            help="months to create after the current one",
+        )
+        parser.add_argument(
+            "--retain-months",
+            type=int,
+            default=settings.SERVICES_PARTITIONING["RETAIN_MONTHS"],
+            help="months to keep attached before the current one",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="drop old partitions instead of keeping them as detached tables",
+        )
+        parser.add_argument(
+            "--enable",
+            action="store_true",
+            help="partition the services table if it is still a plain table",
+        )
+        parser.add_argument(
+            "--disable",
+            action="store_true",
+            help="convert the services table back into a plain table",
+        )
+
+    def handle(self, *args, **options):
+        if options["enable"] and options["disable"]:
+            raise CommandError("--enable and --disable are mutually exclusive")
+
+        with transaction.atomic():
+            if options["disable"]:
+                partitions.disable()
+                self.stdout.write("services table is not partitioned")
+                return
+            if options["enable"]:
+                partitions.enable(months_ahead=options["months_ahead"])
+            if not partitions.is_partitioned():
+                raise CommandError(
+                    "services table is not partitioned, run with --enable first"
+                )
+
+            current = partitions.month_start(datetime.date.today())
+            created = partitions.create_partitions(
+                current, partitions.add_months(current, options["months_ahead"])
+            )
+            detached = []
+            if options["retain_months"] is not None:
+                detached = partitions.detach_partitions(
+                    partitions.add_months(current, -options["retain_months"]),
+                    drop=options["drop"],
+                )
+            if detached:
+                # the rows of the detached partitions left the services table
+                invalidation.publish("services.service")
+
+        for name in created:
+            self.stdout.write(f"created {name}")
+        for name in detached:
+            self.stdout.write(f"{'dropped' if options['drop'] else 'detached'} {name}")
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(created)} created, {len(detached)} detached")
+        )
@@ -0,0 +1,71 @@
+# Python
+import json
+from collections import defaultdict
+
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Summarize the slowest query fingerprints captured by gigflow.slow_queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default=settings.SLOW_QUERIES["LOG_FILE"],
+            help="JSON lines file with the captured queries",
+        )
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--order-by",
+            choices=("total", "max", "count"),
+            default="total",
+            help="rank fingerprints by total or max captured time, or occurrences",
+        )
+        parser.add_argument(
+            "--plans",
+            action="store_true",
+            help="print the plan of the slowest capture of every fingerprint",
+        )
+
+    def handle(self, *args, **options):
+        if not options["file"]:
+            raise CommandError("pass --file or set SLOW_QUERIES_LOG_FILE")
+        try:
+            with open(options["file"]) as file:
+                records = [json.loads(line) for line in file if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"{options['file']} does not exist")
+
+        fingerprints = defaultdict(
+            lambda: {"captures": 0, "count": 0, "total": 0.0, "max": 0.0, "views": set()}
+        )
+        for record in records:
+            summary = fingerprints[record["fingerprint"]]
+            summary["captures"] += 1
+            summary["count"] += 1 + record["skipped"]
+            summary["total"] += record["duration_ms"]
+            summary["views"].add(record["view"])
+            if record["duration_ms"] >= summary["max"]:
+                summary.update(max=record["duration_ms"], slowest=record)
+
+        ranked = sorted(
+            fingerprints.items(),
+            key=lambda item: item[1][options["order_by"]],
+            reverse=True,
+        )[: options["top"]]
+        for key, summary in ranked:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{key}  count={summary['count']}  "
+                    f"avg={summary['total'] / summary['captures']:.1f}ms  max={summary['max']:.1f}ms"
+                )
+            )
+            self.stdout.write(f"  views: {', '.join(sorted(summary['views']))}")
+            self.stdout.write(f"  sql: {summary['slowest']['sql']}")
+            if options["plans"] and summary["slowest"]["plan"]:
+                for line in summary["slowest"]["plan"].splitlines():
+                    self.stdout.write(f"    {line}")
+        if not ranked:
+            self.stdout.write("no slow queries captured")
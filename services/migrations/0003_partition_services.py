@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+from services import partitions
+
+
+def partition_services(apps, schema_editor):
+    if not settings.SERVICES_PARTITIONING["ENABLED"]:
+        return
+    partitions.enable(
+        months_ahead=settings.SERVICES_PARTITIONING["MONTHS_AHEAD"],
+        connection=schema_editor.connection,
+    )
+
+
+def unpartition_services(apps, schema_editor):
+    partitions.disable(connection=schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_alter_service_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_services, unpartition_services),
+    ]
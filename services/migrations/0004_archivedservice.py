@@ -0,0 +1,32 @@
+# Generated by Django 4.1.2 on 2026-10-19 15:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_partition_services'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedService',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=11)),
+                ('tasks', models.TextField()),
+                ('active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('service_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='services.servicetype')),
+            ],
+            options={
+                'db_table': 'services_archive',
+            },
+        ),
+    ]
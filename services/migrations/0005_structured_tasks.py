@@ -0,0 +1,87 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# one task per line of the legacy text, commas and semicolons are part of a
+# task. Texts with blank lines or surrounding spaces would not be restored by
+# joining their lines, they are kept whole as a single task.
+TEXT_TO_LIST = """
+UPDATE {table} SET tasks_list = CASE
+    WHEN tasks = '' THEN '[]'::jsonb
+    WHEN tasks = array_to_string(
+        ARRAY(
+            SELECT btrim(line, E' \\t\\r')
+            FROM regexp_split_to_table(tasks, E'\\n') AS line
+            WHERE btrim(line, E' \\t\\r') <> ''
+        ),
+        E'\\n'
+    ) THEN to_jsonb(regexp_split_to_array(tasks, E'\\n'))
+    ELSE jsonb_build_array(tasks)
+END
+"""
+
+LIST_TO_TEXT = """
+UPDATE {table} SET tasks = array_to_string(
+    ARRAY(SELECT jsonb_array_elements_text(tasks_list)), E'\\n'
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_archivedservice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='tasks_list',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='archivedservice',
+            name='tasks_list',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunSQL(
+            TEXT_TO_LIST.format(table='services'),
+            LIST_TO_TEXT.format(table='services'),
+        ),
+        migrations.RunSQL(
+            TEXT_TO_LIST.format(table='services_archive'),
+            LIST_TO_TEXT.format(table='services_archive'),
+        ),
+        # lets the reverse migration add the text column back to filled tables
+        migrations.AlterField(
+            model_name='service',
+            name='tasks',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='archivedservice',
+            name='tasks',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='service',
+            name='tasks',
+        ),
+        migrations.RemoveField(
+            model_name='archivedservice',
+            name='tasks',
+        ),
+        migrations.RenameField(
+            model_name='service',
+            old_name='tasks_list',
+            new_name='tasks',
+        ),
+        migrations.RenameField(
+            model_name='archivedservice',
+            old_name='tasks_list',
+            new_name='tasks',
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tasks'], name='services_tasks_gin'),
+        ),
+    ]
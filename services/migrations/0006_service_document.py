@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-19 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_structured_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedservice',
+            name='document',
+            field=models.JSONField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='document',
+            field=models.JSONField(editable=False, null=True),
+        ),
+    ]
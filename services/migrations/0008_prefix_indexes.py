@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# case insensitive prefix searches of services.autocomplete, LIKE 'PREFIX%'
+# over UPPER() can only use a btree index with a pattern operator class.
+# Django 4.1 wraps OpClass() index expressions in parentheses, which
+# PostgreSQL rejects, so the indexes are created with raw SQL.
+PREFIX_INDEX = "CREATE INDEX {name} ON {table} (UPPER({column}::text) text_pattern_ops)"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0007_cacheinvalidation'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            PREFIX_INDEX.format(
+                name='services_title_prefix', table='services', column='title'
+            ),
+            'DROP INDEX services_title_prefix',
+        ),
+        migrations.RunSQL(
+            PREFIX_INDEX.format(
+                name='service_types_name_prefix', table='service_types', column='name'
+            ),
+            'DROP INDEX service_types_name_prefix',
+        ),
+    ]
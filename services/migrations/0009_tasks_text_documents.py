@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# stored documents follow ServiceSerializer: tasks back to the legacy text and
+# the list under tasks_list
+TO_TEXT = """
+UPDATE {table} SET document = (document - 'tasks_text') || jsonb_build_object(
+    'tasks', document->'tasks_text', 'tasks_list', document->'tasks'
+)
+WHERE document ? 'tasks_text'
+"""
+
+TO_LIST = """
+UPDATE {table} SET document = (document - 'tasks_list') || jsonb_build_object(
+    'tasks', document->'tasks_list', 'tasks_text', document->'tasks'
+)
+WHERE document ? 'tasks_list'
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            TO_TEXT.format(table='services'), TO_LIST.format(table='services')
+        ),
+        migrations.RunSQL(
+            TO_TEXT.format(table='services_archive'),
+            TO_LIST.format(table='services_archive'),
+        ),
+    ]
@@ -1 +1,2 @@
-from .services import ServiceType, Service
+from .services import ServiceType, Service, ArchivedService
+from .invalidations import CacheInvalidation
@@ -0,0 +1,13 @@
+# Django
+from django.db import models
+
+
+class CacheInvalidation(models.Model):
+    """changes read by the workers when the invalidation bus polls, see
+    services.invalidation"""
+
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = "cache_invalidations"
@@ -1,4 +1,5 @@
 # Django
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 
@@ -20,16 +21,45 @@ class Service(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=11, decimal_places=2)
-    tasks = models.TextField()
+    tasks = models.JSONField(default=list)
     service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE)
 
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # serialized representation, see services.documents
+    document = models.JSONField(null=True, editable=False)
 
     class Meta:
         db_table = "services"
         unique_together = ("title", "service_type")
+        indexes = [GinIndex(fields=["tasks"], name="services_tasks_gin")]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedService(models.Model):
+    """long inactive services moved out of the services table
+
+    Columns mirror ``Service`` in the same order, rows keep their original id.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    price = models.DecimalField(max_digits=11, decimal_places=2)
+    tasks = models.JSONField(default=list)
+    service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE)
+
+    active = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    document = models.JSONField(null=True, editable=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "services_archive"
 
     def __str__(self):
         return self.title
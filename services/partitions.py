@@ -0,0 +1,326 @@
+# Python
+import datetime
+from typing import List, Optional, Tuple
+
+# Django
+from django.db import connection as default_connection
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+TABLE = "services"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_PREFIX = f"{TABLE}_p"
+DETACHED_PREFIX = f"{TABLE}_detached_p"
+SEQUENCE = f"{TABLE}_id_seq"
+
+# names created by 0001/0002, reused so the schema looks the same to django
+PRIMARY_KEY = f"{TABLE}_pkey"
+FOREIGN_KEY = "services_service_type_id_a3ca8de1_fk_service_types_id"
+SERVICE_TYPE_INDEX = "services_service_type_id_a3ca8de1"
+UNIQUE_TOGETHER = "services_title_service_type_id_93da0971_uniq"
+
+# (title, service_type) can not be unique on a table partitioned by created_at,
+# a trigger keeps every live key in this table instead
+UNIQUE_KEYS = f"{TABLE}_unique_keys"
+
+UNIQUE_KEYS_SQL = f"""
+CREATE TABLE {UNIQUE_KEYS} (
+    title varchar(255) NOT NULL,
+    service_type_id bigint NOT NULL,
+    CONSTRAINT {UNIQUE_TOGETHER} PRIMARY KEY (title, service_type_id)
+);
+INSERT INTO {UNIQUE_KEYS} (title, service_type_id)
+    SELECT title, service_type_id FROM {TABLE};
+
+CREATE FUNCTION {UNIQUE_KEYS}_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+        AND OLD.title = NEW.title
+        AND OLD.service_type_id = NEW.service_type_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {UNIQUE_KEYS}
+            WHERE title = OLD.title AND service_type_id = OLD.service_type_id;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        INSERT INTO {UNIQUE_KEYS} (title, service_type_id)
+            VALUES (NEW.title, NEW.service_type_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {UNIQUE_KEYS}_sync
+    AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {UNIQUE_KEYS}_sync();
+"""
+
+
+def month_start(value: datetime.date) -> datetime.date:
+    """first day of the month of a date"""
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(value: datetime.date, months: int) -> datetime.date:
+    """move the first day of a month some months forward or backwards"""
+    month = value.month - 1 + months
+    return datetime.date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(start: datetime.date) -> str:
+    """name of the monthly partition starting at a date"""
+    return f"{PARTITION_PREFIX}{start:%Y%m}"
+
+
+def _bound(value: datetime.date) -> str:
+    return f"{value.isoformat()} 00:00:00+00"
+
+
+def _table_exists(name: str, connection: BaseDatabaseWrapper) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        return cursor.fetchone()[0]
+
+
+def is_partitioned(connection: BaseDatabaseWrapper = default_connection) -> bool:
+    """check if the services table is a partitioned table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_class WHERE relname = %s AND relkind = 'p')",
+            [TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions(
+    connection: BaseDatabaseWrapper = default_connection,
+) -> List[Tuple[str, datetime.date]]:
+    """list the attached monthly partitions
+
+    Returns:
+        List[Tuple[str, datetime.date]]: partition names and their first day
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND child.relname LIKE %s
+            ORDER BY child.relname
+            """,
+            [TABLE, f"{PARTITION_PREFIX}%"],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return [
+        (name, datetime.datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m").date())
+        for name in names
+    ]
+
+
+def create_partition(
+    start: datetime.date, connection: BaseDatabaseWrapper = default_connection
+) -> bool:
+    """create the monthly partition starting at a date
+
+    Rows of that month already stored in the default partition are moved into
+    the new partition before attaching it.
+
+    Args:
+        start (datetime.date): any day of the month to create
+    Returns:
+        bool: False if the partition already exists
+    """
+    start = month_start(start)
+    name = partition_name(start)
+    if name in dict(list_partitions(connection)):
+        return False
+    lower, upper = _bound(start), _bound(add_months(start, 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE})")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+        # the trigger released the keys of the rows deleted from the default
+        if _table_exists(UNIQUE_KEYS, connection):
+            cursor.execute(
+                f"INSERT INTO {UNIQUE_KEYS} (title, service_type_id) "
+                f"SELECT title, service_type_id FROM {name}"
+            )
+    return True
+
+
+def create_partitions(
+    start: datetime.date,
+    end: datetime.date,
+    connection: BaseDatabaseWrapper = default_connection,
+) -> List[str]:
+    """create every missing monthly partition between two dates (both included)
+
+    Returns:
+        List[str]: names of the created partitions
+    """
+    created = []
+    current, last = month_start(start), month_start(end)
+    while current <= last:
+        if create_partition(current, connection):
+            created.append(partition_name(current))
+        current = add_months(current, 1)
+    return created
+
+
+def detach_partitions(
+    before: datetime.date,
+    drop: bool = False,
+    connection: BaseDatabaseWrapper = default_connection,
+) -> List[str]:
+    """detach the monthly partitions ending on or before a date
+
+    Detached partitions are kept as standalone ``services_detached_pYYYYMM``
+    tables unless ``drop`` is set. Their rows leave the live table, so their
+    (title, service_type) keys are released.
+
+    Returns:
+        List[str]: names of the detached partitions
+    """
+    detached = []
+    with connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        for name, start in list_partitions(connection):
+            if add_months(start, 1) > before:
+                continue
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            cursor.execute(
+                f"""
+                DELETE FROM {UNIQUE_KEYS} AS k USING {name} AS p
+                WHERE k.title = p.title AND k.service_type_id = p.service_type_id
+                """
+            )
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+            else:
+                cursor.execute(
+                    f"ALTER TABLE {name} RENAME TO {DETACHED_PREFIX}{start:%Y%m}"
+                )
+            detached.append(name)
+    return detached
+
+
+def enable(
+    months_ahead: int = 0,
+    today: Optional[datetime.date] = None,
+    connection: BaseDatabaseWrapper = default_connection,
+) -> None:
+    """convert the services table into a table partitioned by month
+
+    Existing rows are copied into monthly partitions covering them, up to
+    ``months_ahead`` months after today.
+    """
+    if is_partitioned(connection):
+        return
+    today = today or datetime.date.today()
+    staging = f"{TABLE}_partitioned"
+    with connection.cursor() as cursor:
+        # deferred foreign key checks would block dropping the legacy table
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"SELECT min(created_at), max(id) FROM {TABLE}")
+        oldest, max_id = cursor.fetchone()
+        indexes = _other_indexes(cursor)
+        cursor.execute(
+            f"CREATE TABLE {staging} (LIKE {TABLE}) PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT")
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {TABLE}_staging")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy")
+        cursor.execute(f"ALTER TABLE {TABLE}_staging RENAME TO {TABLE}")
+        create_partitions(
+            oldest.date() if oldest else today,
+            add_months(month_start(today), months_ahead),
+            connection,
+        )
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_legacy")
+        cursor.execute(f"DROP TABLE {TABLE}_legacy")
+        cursor.execute(f"CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [SEQUENCE, (max_id or 0) + 1])
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {PRIMARY_KEY} PRIMARY KEY (id, created_at)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {FOREIGN_KEY} "
+            "FOREIGN KEY (service_type_id) REFERENCES service_types (id) "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(f"CREATE INDEX {SERVICE_TYPE_INDEX} ON {TABLE} (service_type_id)")
+        cursor.execute(f"CREATE INDEX {TABLE}_created_at ON {TABLE} (created_at)")
+        for index in indexes:
+            cursor.execute(index)
+        cursor.execute(UNIQUE_KEYS_SQL)
+
+
+def _other_indexes(cursor) -> List[str]:
+    """definitions of the indexes of the services table recreated as they are,
+    e.g. the ones of ``Service.Meta.indexes``"""
+    cursor.execute(
+        """
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+        AND indexname NOT IN (%s, %s)
+        AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+        )
+        """,
+        [TABLE, SERVICE_TYPE_INDEX, f"{TABLE}_created_at", TABLE],
+    )
+    # indexes of a partitioned table are defined ON ONLY it, which would not
+    # create them on the partitions
+    return [row[0].replace(" ON ONLY ", " ON ", 1) for row in cursor.fetchall()]
+
+
+def disable(connection: BaseDatabaseWrapper = default_connection) -> None:
+    """convert the partitioned services table back into a plain table"""
+    if not is_partitioned(connection):
+        return
+    with connection.cursor() as cursor:
+        # deferred foreign key checks would block dropping the partitions
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        indexes = _other_indexes(cursor)
+        cursor.execute(f"CREATE TABLE {TABLE}_plain (LIKE {TABLE})")
+        cursor.execute(f"INSERT INTO {TABLE}_plain SELECT * FROM {TABLE}")
+        cursor.execute(f"SELECT max(id) FROM {TABLE}")
+        max_id = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"DROP TABLE {UNIQUE_KEYS}")
+        cursor.execute(f"DROP FUNCTION {UNIQUE_KEYS}_sync()")
+        cursor.execute(f"ALTER TABLE {TABLE}_plain RENAME TO {TABLE}")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY "
+            f"(START WITH {(max_id or 0) + 1})"
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {PRIMARY_KEY} PRIMARY KEY (id)")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {UNIQUE_TOGETHER} "
+            "UNIQUE (title, service_type_id)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {FOREIGN_KEY} "
+            "FOREIGN KEY (service_type_id) REFERENCES service_types (id) "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(f"CREATE INDEX {SERVICE_TYPE_INDEX} ON {TABLE} (service_type_id)")
+        for index in indexes:
+            cursor.execute(index)
@@ -1,5 +1,11 @@
+# Django
+from django.conf import settings
+
 # Django REST Framework
 from rest_framework import serializers
+
+# Docs
+from drf_spectacular.utils import extend_schema_field
 # Models
 from services.models import services as services_models
 
@@ -11,8 +17,37 @@ class ServiceTypeSerializer(serializers.ModelSerializer):
         exclude = ('created_at', 'updated_at')
 
 
+@extend_schema_field({
+    'type': 'string',
+    'description': 'Tasks one per line, a list of tasks is also accepted',
+})
+class TasksField(serializers.Field):
+    """tasks as the legacy text with one task per line, also accepting a list
+
+    Responses keep the text until clients move to ``tasks_list``.
+    """
+
+    default_error_messages = {
+        'invalid': 'Expected a list of tasks or a text.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split('\n')
+        elif not isinstance(data, list) or not all(
+                isinstance(task, str) for task in data):
+            self.fail('invalid')
+        return [task.strip() for task in data if task.strip()]
+
+    def to_representation(self, value):
+        return '\n'.join(value)
+
+
 class ServiceSerializer(serializers.ModelSerializer):
 
+    tasks = TasksField()
+    tasks_list = serializers.ListField(
+        child=serializers.CharField(), source='tasks', read_only=True)
     service_type = ServiceTypeSerializer(read_only=True)
     service_type_id = serializers.PrimaryKeyRelatedField(
         write_only=True,
@@ -22,4 +57,68 @@ class ServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = services_models.Service
-        fields = '__all__'
+        exclude = ('document',)
+
+
+class ServiceBatchSerializer(serializers.Serializer):
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.SERVICES_BATCH_MAX_IDS)
+
+
+class ServiceBatchResponseSerializer(serializers.Serializer):
+
+    data = ServiceSerializer(many=True)
+    missing = serializers.ListField(child=serializers.IntegerField())
+    inactive = serializers.ListField(child=serializers.IntegerField())
+
+
+class SimilarServicesSerializer(serializers.Serializer):
+
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.SIMILARITY_INDEX['MAX_LIMIT'],
+        default=settings.SIMILARITY_INDEX['DEFAULT_LIMIT'],
+    )
+    same_type = serializers.BooleanField(default=False)
+
+
+class SimilarServiceSerializer(serializers.Serializer):
+
+    score = serializers.FloatField()
+    service = ServiceSerializer()
+
+
+class SimilarServicesResponseSerializer(serializers.Serializer):
+
+    data = SimilarServiceSerializer(many=True)
+
+
+class AutocompleteSerializer(serializers.Serializer):
+
+    q = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.AUTOCOMPLETE['MAX_LIMIT'],
+        default=settings.AUTOCOMPLETE['DEFAULT_LIMIT'],
+    )
+
+
+class ServiceSuggestionSerializer(serializers.Serializer):
+
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+
+
+class ServiceTypeSuggestionSerializer(serializers.Serializer):
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class AutocompleteResponseSerializer(serializers.Serializer):
+
+    services = ServiceSuggestionSerializer(many=True)
+    service_types = ServiceTypeSuggestionSerializer(many=True)
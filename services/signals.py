@@ -0,0 +1,30 @@
+# Django
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# Models
+from services.models import services as services_models
+
+from services import documents, invalidation
+
+
+@receiver(post_save, sender=services_models.Service)
+def refresh_service_document(sender, instance, **kwargs):
+    """keep the stored document of a service up to date"""
+    documents.refresh(instance)
+
+
+@receiver(post_save, sender=services_models.ServiceType)
+def refresh_service_type_documents(sender, instance, created, **kwargs):
+    """update the nested service type of the stored service documents"""
+    if not created:
+        documents.refresh_service_type(instance)
+
+
+@receiver(post_save, sender=services_models.Service)
+@receiver(post_delete, sender=services_models.Service)
+@receiver(post_save, sender=services_models.ServiceType)
+@receiver(post_delete, sender=services_models.ServiceType)
+def publish_change(sender, instance, **kwargs):
+    """evict the cached copies of the changed row in every worker"""
+    invalidation.publish(sender._meta.label_lower, [instance.pk])
@@ -0,0 +1,461 @@
+"""Similar services from a precomputed TF-IDF index
+
+Every active service is a L2 normalized TF-IDF vector of the words of its
+title, description and tasks, hashed into ``FEATURES`` terms. The index
+stores the vectors as NumPy arrays:
+
+- ``ids``, ``types``: service and service type of every row, sorted by id
+- ``indptr``, ``indices``, ``data``: the vectors by row (CSR)
+- ``term_indptr``, ``term_rows``, ``term_data``: the vectors by term (CSC),
+  so a query only reads the services sharing a word with it
+- ``idf``: inverse document frequency of every term
+
+``build_similarity_index`` writes each build to a new directory and then
+swaps the ``current`` symlink, workers memory-map the arrays of the current
+build so every gunicorn worker shares the same pages of the OS page cache.
+Services written after a build are vectorized again from the database into a
+per-process overlay, kept up to date through the invalidation bus, until the
+next build. Past ``REBUILD_AFTER`` written services a worker builds the index
+again in the background.
+"""
+
+# Python
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Container, Dict, Iterable, List, Optional, Set, Tuple
+
+# Django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+# NumPy
+import numpy as np
+
+# Models
+from services.models import services as services_models
+
+from services import invalidation
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+")
+# words too common to tell services apart, in english and spanish
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be by for from in is it of on or that the this to with
+    al con de del el en es la las lo los o para por que se su un una y
+    """.split()
+)
+# words of the title count as many times as the ones of the description
+TITLE_WEIGHT = 2
+ARRAYS = (
+    "ids",
+    "types",
+    "indptr",
+    "indices",
+    "data",
+    "term_indptr",
+    "term_rows",
+    "term_data",
+    "idf",
+)
+FIELDS = ("id", "service_type_id", "title", "description", "tasks")
+# advisory lock of the background rebuilds, see rebuild_in_background
+REBUILD_LOCK = zlib.crc32(b"gigflow_similarity_rebuild")
+REBUILD_RETRY_SECONDS = 300
+
+Vector = Tuple[np.ndarray, np.ndarray]
+
+
+def term_counts(title: str, description: str, tasks, features: int) -> Dict[int, float]:
+    """count the hashed words of a service"""
+    counts: Dict[int, float] = Counter()
+    tasks = " ".join(map(str, tasks)) if isinstance(tasks, list) else str(tasks or "")
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1), (tasks, 1)):
+        for token in TOKEN.findall((text or "").lower()):
+            if token in STOP_WORDS:
+                continue
+            # crc32 is stable between processes, unlike hash()
+            counts[zlib.crc32(token.encode()) % features] += weight
+    return counts
+
+
+def vectorize(counts: Dict[int, float], idf: np.ndarray) -> Vector:
+    """weight term counts into a normalized vector
+
+    Returns:
+        Vector: sorted terms and their weights
+    """
+    terms = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    order = np.argsort(terms)
+    terms = terms[order]
+    tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))[order]
+    weights = (1 + np.log(tf)) * idf[terms]
+    norm = np.linalg.norm(weights)
+    return terms, (weights / norm if norm else weights).astype(np.float32)
+
+
+def build(directory: Path, batch_size: int = 1000) -> Path:
+    """write an index of the active services and make it the current one
+
+    Args:
+        directory (Path): directory of the index builds
+        batch_size (int): services read per query
+    Returns:
+        Path: directory of the new build
+    """
+    features = settings.SIMILARITY_INDEX["FEATURES"]
+    # services written while building are caught by the overlay
+    built_at = timezone.now()
+    ids, types, rows = [], [], []
+    queryset = (
+        services_models.Service.objects.filter(active=True)
+        .order_by("id")
+        .values_list(*FIELDS)
+    )
+    for id, service_type_id, title, description, tasks in queryset.iterator(
+        chunk_size=batch_size
+    ):
+        counts = term_counts(title, description, tasks, features)
+        ids.append(id)
+        types.append(service_type_id)
+        rows.append(counts)
+
+    document_frequency = np.zeros(features, dtype=np.int64)
+    for counts in rows:
+        document_frequency[list(counts)] += 1
+    idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    vectors = [vectorize(counts, idf) for counts in rows]
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(terms) for terms, _ in vectors])
+    indices = np.concatenate([terms for terms, _ in vectors] or [np.zeros(0, np.int32)])
+    data = np.concatenate(
+        [weights for _, weights in vectors] or [np.zeros(0, np.float32)]
+    )
+
+    # the same entries grouped by term
+    order = np.argsort(indices, kind="stable")
+    row_of_entry = np.repeat(np.arange(len(vectors), dtype=np.int32), np.diff(indptr))
+    term_indptr = np.zeros(features + 1, dtype=np.int64)
+    term_indptr[1:] = np.cumsum(np.bincount(indices, minlength=features))
+
+    arrays = {
+        "ids": np.array(ids, dtype=np.int64),
+        "types": np.array(types, dtype=np.int64),
+        "indptr": indptr,
+        "indices": indices,
+        "data": data,
+        "term_indptr": term_indptr,
+        "term_rows": row_of_entry[order],
+        "term_data": data[order],
+        "idf": idf,
+    }
+    directory.mkdir(parents=True, exist_ok=True)
+    version = f"{built_at:%Y%m%d%H%M%S%f}"
+    partial = directory / f".{version}"
+    partial.mkdir()
+    for name, array in arrays.items():
+        np.save(partial / f"{name}.npy", array)
+    (partial / "meta.json").write_text(
+        json.dumps(
+            {"built_at": built_at.isoformat(), "count": len(ids), "features": features}
+        )
+    )
+    path = directory / version
+    partial.rename(path)
+
+    # a symlink replaced by rename is swapped atomically for the readers
+    link = directory / f".current-{version}"
+    link.symlink_to(version)
+    os.replace(link, directory / "current")
+    _prune(directory, settings.SIMILARITY_INDEX["KEEP_BUILDS"])
+    return path
+
+
+def _prune(directory: Path, keep: int) -> None:
+    """delete the oldest builds, workers still mapping them keep their pages"""
+    builds = sorted(
+        path
+        for path in directory.iterdir()
+        if path.is_dir() and not path.name.startswith(".")
+    )
+    current = (directory / "current").resolve()
+    for path in builds[:-keep]:
+        if path.resolve() != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _load(path: Path) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # empty arrays can not be memory-mapped
+        return np.load(path)
+
+
+class Index:
+    """Memory-mapped build of the index"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        meta = json.loads((path / "meta.json").read_text())
+        self.built_at = datetime.datetime.fromisoformat(meta["built_at"])
+        self.features = meta["features"]
+        for name in ARRAYS:
+            setattr(self, name, _load(path / f"{name}.npy"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """rows of the indexed services among some ids"""
+        positions = np.searchsorted(self.ids, ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == ids[found]
+        return positions[found]
+
+    def scores(self, vector: Vector) -> np.ndarray:
+        """cosine similarity of every row with a vector"""
+        rows, weights = [], []
+        for term, weight in zip(*vector):
+            start, end = self.term_indptr[term], self.term_indptr[term + 1]
+            if start != end:
+                rows.append(self.term_rows[start:end])
+                weights.append(self.term_data[start:end] * weight)
+        if not rows:
+            return np.zeros(len(self))
+        return np.bincount(
+            np.concatenate(rows), weights=np.concatenate(weights), minlength=len(self)
+        )
+
+
+class Stack:
+    """Overlay vectors laid out as arrays to score them at once"""
+
+    def __init__(self, vectors: Dict[int, Optional[Tuple[int, Vector]]]):
+        active = [(id, entry) for id, entry in vectors.items() if entry is not None]
+        # every written service, its vector in the index is outdated
+        self.written = np.fromiter(vectors, dtype=np.int64, count=len(vectors))
+        self.ids = np.array([id for id, _ in active], dtype=np.int64)
+        self.types = np.array([entry[0] for _, entry in active], dtype=np.int64)
+        self.rows = np.repeat(
+            np.arange(len(active), dtype=np.int64),
+            [len(entry[1][0]) for _, entry in active],
+        ).astype(np.int64)
+        self.indices = np.concatenate(
+            [entry[1][0] for _, entry in active] or [np.zeros(0, np.int32)]
+        )
+        self.data = np.concatenate(
+            [entry[1][1] for _, entry in active] or [np.zeros(0, np.float32)]
+        )
+
+    def scores(self, vector: Vector) -> np.ndarray:
+        """cosine similarity of every vector with another one"""
+        terms, weights = vector
+        if not len(terms) or not len(self.indices):
+            return np.zeros(len(self.ids))
+        positions = np.searchsorted(terms, self.indices).clip(max=len(terms) - 1)
+        matches = terms[positions] == self.indices
+        return np.bincount(
+            self.rows[matches],
+            weights=self.data[matches] * weights[positions[matches]],
+            minlength=len(self.ids),
+        )
+
+
+class Overlay:
+    """Vectors of the services written after the build of the index
+
+    Registered in the invalidation bus like a cache: evicted ids are read
+    again from the database on the next query, clearing it reads every
+    service updated since the build and the ones added or deactivated since
+    then whatever their ``updated_at``, e.g. imported with their timestamps.
+    Refreshes run one at a time so none of them loses the vectors of another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._dirty: Set[int] = set()
+        self._everything = True
+        # None marks services that are no longer active
+        self.vectors: Dict[int, Optional[Tuple[int, Vector]]] = {}
+        self.stack = Stack(self.vectors)
+
+    def evict(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._everything = True
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def refresh(self, index: Index) -> None:
+        """vectorize the services written since the last refresh"""
+        with self._refreshing:
+            with self._lock:
+                dirty, everything = self._dirty, self._everything
+                self._dirty, self._everything = set(), False
+            if not dirty and not everything:
+                return
+            queryset = services_models.Service.objects.values_list("active", *FIELDS)
+            if everything:
+                active_ids = np.fromiter(
+                    services_models.Service.objects.filter(active=True).values_list(
+                        "id", flat=True
+                    ),
+                    dtype=np.int64,
+                )
+                vectors = dict.fromkeys(np.setdiff1d(index.ids, active_ids).tolist())
+                queryset = queryset.filter(
+                    Q(updated_at__gte=index.built_at)
+                    | Q(id__in=np.setdiff1d(active_ids, index.ids).tolist())
+                )
+            else:
+                vectors = dict(self.vectors)
+                vectors.update(dict.fromkeys(dirty))
+                queryset = queryset.filter(id__in=dirty)
+            for active, id, service_type_id, title, description, tasks in queryset:
+                if active:
+                    counts = term_counts(title, description, tasks, index.features)
+                    vectors[id] = (service_type_id, vectorize(counts, index.idf))
+                else:
+                    vectors[id] = None
+            self.vectors, self.stack = vectors, Stack(vectors)
+
+
+overlay = invalidation.register(Overlay(), "services.service")
+
+_lock = threading.Lock()
+_index: Optional[Index] = None
+_rebuilding = threading.Lock()
+_rebuild_tried_at = -REBUILD_RETRY_SECONDS
+
+
+def current() -> Optional[Index]:
+    """get the current build, loading it if it changed since the last call"""
+    global _index
+    link = Path(settings.SIMILARITY_INDEX["DIRECTORY"]) / "current"
+    if not link.exists():
+        return None
+    path = link.resolve()
+    with _lock:
+        if _index is None or _index.path != path:
+            _index = Index(path)
+            overlay.clear()
+        return _index
+
+
+def rebuild_in_background() -> bool:
+    """build a new index in a thread, once for every worker
+
+    Started when the overlay grows past ``REBUILD_AFTER`` services. A
+    PostgreSQL advisory lock keeps the other workers from building at the
+    same time, they load the new build on their next query.
+
+    Returns:
+        bool: False if this process is already building or tried recently
+    """
+    global _rebuild_tried_at
+    with _lock:
+        now = time.monotonic()
+        if _rebuilding.locked() or now - _rebuild_tried_at < REBUILD_RETRY_SECONDS:
+            return False
+        _rebuild_tried_at = now
+        _rebuilding.acquire()
+
+    def run():
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [REBUILD_LOCK])
+                if cursor.fetchone()[0]:
+                    build(Path(settings.SIMILARITY_INDEX["DIRECTORY"]))
+        except Exception:
+            logger.exception("similarity index rebuild failed")
+        finally:
+            # closing the connection releases the advisory lock
+            connection.close()
+            _rebuilding.release()
+
+    threading.Thread(target=run, name="similarity-rebuild", daemon=True).start()
+    return True
+
+
+def similar(
+    index: Index,
+    service_id: int,
+    limit: int,
+    same_type: bool = False,
+    available: Optional[Callable[[List[int]], Container[int]]] = None,
+) -> Optional[List[Tuple[int, float]]]:
+    """find the services most similar to an active one
+
+    Args:
+        index (Index): current build
+        service_id (int): compared service
+        limit (int): maximum number of services
+        same_type (bool): only services of the same service type
+        available (Optional[Callable[[List[int]], Container[int]]]): gets the
+            ids that can still be returned among some candidates, e.g. not
+            archived by a write the overlay did not see. More candidates are
+            checked until the limit is filled.
+    Returns:
+        Optional[List[Tuple[int, float]]]: ids and scores, best first, None if
+            the service does not exist or is inactive
+    """
+    row = (
+        services_models.Service.objects.filter(id=service_id, active=True)
+        .values_list(*FIELDS[1:])
+        .first()
+    )
+    if row is None:
+        return None
+    service_type_id, title, description, tasks = row
+    overlay.refresh(index)
+    if len(overlay) >= settings.SIMILARITY_INDEX["REBUILD_AFTER"]:
+        rebuild_in_background()
+    vector = vectorize(
+        term_counts(title, description, tasks, index.features), index.idf
+    )
+
+    scores = index.scores(vector)
+    # the overlay has the current vector of the services written since the build
+    stack = overlay.stack
+    scores[index.positions(np.append(stack.written, service_id))] = 0
+    written_scores = stack.scores(vector)
+    written_scores[stack.ids == service_id] = 0
+    if same_type:
+        scores[np.asarray(index.types) != service_type_id] = 0
+        written_scores[stack.types != service_type_id] = 0
+    ids = np.concatenate([index.ids, stack.ids])
+    scores = np.concatenate([scores, written_scores])
+
+    candidates = np.flatnonzero(scores > 0)
+    fetch = limit
+    while True:
+        top = candidates
+        if fetch < len(candidates):
+            top = candidates[np.argpartition(-scores[candidates], fetch)[:fetch]]
+        top = top[np.lexsort((ids[top], -scores[top]))]
+        results = [(int(ids[row]), float(scores[row])) for row in top]
+        if available is not None:
+            kept = available([id for id, _ in results])
+            results = [result for result in results if result[0] in kept]
+        if len(results) >= limit or len(top) == len(candidates):
+            return results[:limit]
+        fetch *= 4
@@ -1,10 +1,59 @@
+# Python
+import datetime
+import decimal
+import importlib
+import io
+import json
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 # Django
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    connection,
+    connections,
+    transaction,
+)
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+# NumPy
+import numpy as np
 
 # Models
+from services.models import invalidations as invalidations_models
 from services.models import services as services_models
 
+# Serializers
+from services.serializers import services as services_serializers
+
+# Views
+from services.views import services as services_views
+
+from gigflow import prepared, slow_queries
+from gigflow.coalescing import SingleFlight
+from gigflow.prepared import PreparedQueries
+
+from services import (
+    archive,
+    autocomplete,
+    documents,
+    invalidation,
+    partitions,
+    similarity,
+)
+
 
 class ServiceTypeViewTests(TestCase):
     def test_no_data_paginated_service_types(self):
@@ -259,3 +308,1609 @@ class ServiceViewTests(TestCase):
         response = self.client.get(reverse("services") + query_params)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['data']), 1)
+
+
+    def test_create_service_with_task_list(self):
+        """tasks are stored as a list and accepted as legacy text"""
+        data = {
+            "title": "task_list_service",
+            "description": "task_list_service_description",
+            "price": 100.25,
+            "tasks": ["paint", " clean ", ""],
+            "service_type_id": self.service_type.id,
+            "active": True,
+        }
+        response = self.client.post(
+            reverse("services"), data=data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["tasks"], "paint\nclean")
+        self.assertEqual(response.data["tasks_list"], ["paint", "clean"])
+
+        response = self.client.patch(
+            reverse("one_service", kwargs={"service_id": response.data["id"]}),
+            data={"tasks": "paint\nclean, then polish; fast\n"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["tasks"], "paint\nclean, then polish; fast")
+        self.assertEqual(
+            response.data["tasks_list"], ["paint", "clean, then polish; fast"]
+        )
+
+        response = self.client.patch(
+            reverse("one_service", kwargs={"service_id": response.data["id"]}),
+            data={"tasks": [1, 2]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_legacy_tasks_migration_round_trip(self):
+        """legacy texts are split on lines only and restored exactly"""
+        migration = importlib.import_module("services.migrations.0005_structured_tasks")
+        texts = ["", "clean, then polish", "paint\nclean; fix", "a\n\nb", " lead"]
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE legacy (tasks text, tasks_list jsonb)")
+            cursor.executemany(
+                "INSERT INTO legacy (tasks) VALUES (%s)", [[text] for text in texts]
+            )
+            cursor.execute(migration.TEXT_TO_LIST.format(table="legacy"))
+            cursor.execute("SELECT tasks_list FROM legacy")
+            self.assertEqual(
+                [json.loads(row[0]) for row in cursor.fetchall()],
+                [
+                    [],
+                    ["clean, then polish"],
+                    ["paint", "clean; fix"],
+                    ["a\n\nb"],
+                    [" lead"],
+                ],
+            )
+            cursor.execute("UPDATE legacy SET tasks = NULL")
+            cursor.execute(migration.LIST_TO_TEXT.format(table="legacy"))
+            cursor.execute("SELECT tasks FROM legacy")
+            self.assertEqual([row[0] for row in cursor.fetchall()], texts)
+
+    def test_filter_services_by_task(self):
+        """filter services containing a task"""
+        for title, tasks in (("paint_service", ["paint", "clean"]), ("fix_service", ["fix"])):
+            services_models.Service.objects.create(
+                title=title,
+                description="description",
+                price=10,
+                tasks=tasks,
+                service_type=self.service_type,
+            )
+        response = self.client.get(reverse("services"), {"task": "paint"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [service["title"] for service in response.data["data"]], ["paint_service"]
+        )
+        queryset = services_models.Service.objects.filter(
+            services_views.ServiceView()._get_filters({"task": "paint"})
+        )
+        self.assertIn("@>", str(queryset.query))
+
+
+class ServiceFilterTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(
+            name="service_type", active=True
+        )
+        for i in range(7):
+            services_models.Service.objects.create(
+                title=f"filtered_{i}",
+                description="description",
+                price=10 + i,
+                tasks=["paint"] if i % 2 else ["fix"],
+                active=i != 6,
+                service_type=self.service_type,
+            )
+        services_views.services_list_statements.reset()
+        self.addCleanup(services_views.services_list_statements.reset)
+        prepared = override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, ENABLED=True)
+        )
+        prepared.enable()
+        self.addCleanup(prepared.disable)
+        self._conn_max_age(60)
+
+    def _conn_max_age(self, seconds: int) -> None:
+        configured = connection.settings_dict["CONN_MAX_AGE"]
+        connection.settings_dict["CONN_MAX_AGE"] = seconds
+        self.addCleanup(connection.settings_dict.__setitem__, "CONN_MAX_AGE", configured)
+
+    def test_invalid_filters_are_rejected(self):
+        """invalid filter values answer a 400 naming the params"""
+        response = self.client.get(
+            reverse("services"),
+            {"minimum_price": "cheap", "start_date": "yesterday", "active": "maybe"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            set(response.data), {"minimum_price", "start_date", "active"}
+        )
+        response = self.client.get(reverse("services"), {"service_type": "1.5"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("service_types"), {"active": "maybe"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_canonical_key(self):
+        """equivalent spellings of the filters share a key"""
+        filter_set = services_views.ServiceView.filter_set
+        first = filter_set.compile(
+            {"minimum_price": "10.50", "start_date": "2026-08-01", "active": "true"}
+        )
+        second = filter_set.compile(
+            {"minimum_price": "10.5", "start_date": "2026-08-01T00:00:00Z", "active": "1"}
+        )
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(first.shape, (("active", "true"), "minimum_price", "start_date"))
+        self.assertEqual(filter_set.compile({"end_date": "2026-08-01"}).key, ())
+
+    def test_prepared_list_matches_django(self):
+        """hot filter combinations run as prepared statements with the same results"""
+        params = {
+            "active": "true",
+            "title": "FILTERED",
+            "task": "paint",
+            "service_type": self.service_type.id,
+            "minimum_price": 10,
+            "maximum_price": 20,
+            "start_date": "2020-01-01",
+            "end_date": "2100-01-01",
+            "page_size": 2,
+        }
+        with override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, ENABLED=False)
+        ):
+            expected = [
+                self.client.get(reverse("services"), dict(params, page=page)).data
+                for page in (1, 2)
+            ]
+        with override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, HOT_AFTER=1)
+        ):
+            for page in (1, 2):
+                response = self.client.get(reverse("services"), dict(params, page=page))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, expected[page - 1])
+            self.assertEqual(response.data["count"], 3)
+            response = self.client.get(
+                reverse("services"), dict(params, task="fix", active="true", page=1)
+            )
+            self.assertEqual(
+                [service["title"] for service in response.data["data"]],
+                ["filtered_4", "filtered_2"],
+            )
+        self.assertEqual(services_views.services_list_statements.stats()["prepared"], 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_prepared_statements WHERE name LIKE 'gigflow_%%'"
+            )
+            self.assertGreaterEqual(cursor.fetchone()[0], 2)
+
+    def test_not_prepared_without_persistent_connections(self):
+        """statements are not prepared on connections closed after every request"""
+        self.assertEqual(prepared.check_connection_reuse(None), [])
+        self._conn_max_age(0)
+        self.assertEqual(
+            [message.id for message in prepared.check_connection_reuse(None)],
+            ["gigflow.W001"],
+        )
+        statements = PreparedQueries("test")
+        queryset = services_models.Service.objects.filter(price__gte=10).values_list("id")
+        with override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, HOT_AFTER=1)
+        ):
+            self.assertIs(statements.query("price", [10], lambda: queryset), queryset)
+        self.assertEqual(statements.stats()["prepared"], 0)
+
+    def test_unsupported_shape_stays_on_django(self):
+        """a shape whose params differ from django's is never prepared"""
+        statements = PreparedQueries("test")
+        queryset = services_models.Service.objects.filter(price__gte=10).values_list("id")
+        with override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, HOT_AFTER=1)
+        ):
+            rows = statements.query("price", ["not the price"], lambda: queryset)
+            self.assertIs(rows, queryset)
+            self.assertIs(statements.query("price", [10], lambda: queryset), queryset)
+        self.assertEqual(statements.stats()["unsupported"], 1)
+
+    def test_statements_per_connection_are_bounded(self):
+        """the least recently used statements are deallocated"""
+        statements = PreparedQueries("test")
+        with override_settings(
+            PREPARED_STATEMENTS=dict(
+                settings.PREPARED_STATEMENTS, HOT_AFTER=1, MAX_PER_CONNECTION=1
+            )
+        ):
+            for price in (10, 11):
+                rows = statements.query(
+                    price,
+                    [price],
+                    lambda: services_models.Service.objects.filter(
+                        price__gte=price
+                    ).values_list("id"),
+                )
+                self.assertEqual(rows.count(), 17 - price)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_prepared_statements WHERE name LIKE 'gigflow_%%'"
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class ServicePartitioningTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(
+            name="partitioned", active=True
+        )
+        self.today = datetime.date(2026, 10, 19)
+        # migration 0003 may have partitioned the table from the real date
+        partitions.disable()
+        partitions.enable(months_ahead=1, today=self.today)
+        partitions.create_partitions(datetime.date(2026, 7, 1), self.today)
+
+    def _create_service(self, title: str, created_at: datetime.datetime):
+        service = services_models.Service.objects.create(
+            title=title,
+            description="description",
+            price=10,
+            tasks=["tasks"],
+            service_type=self.service_type,
+        )
+        services_models.Service.objects.filter(id=service.id).update(
+            created_at=created_at
+        )
+        return service
+
+    def test_partitions_created(self):
+        """monthly partitions cover the requested range"""
+        self.assertTrue(partitions.is_partitioned())
+        # from the first created month to one month ahead of the used date
+        first = partitions.month_start(datetime.date(2026, 7, 1))
+        months = (self.today.year - first.year) * 12 + self.today.month - first.month
+        self.assertEqual(
+            [name for name, _ in partitions.list_partitions()],
+            [
+                partitions.partition_name(partitions.add_months(first, month))
+                for month in range(months + 2)
+            ],
+        )
+
+    def test_date_filtered_list_prunes_partitions(self):
+        """a start_date/end_date range only scans the matching partition"""
+        for month in (7, 8, 9):
+            self._create_service(
+                f"service {month}",
+                datetime.datetime(2026, month, 15, tzinfo=datetime.timezone.utc),
+            )
+
+        params = {"start_date": "2026-08-01T00:00:00Z", "end_date": "2026-08-31T00:00:00Z"}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("services"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(
+            [service["title"] for service in response.data["data"]], ["service 8"]
+        )
+
+        # the count and the page queries of the list
+        statements = [
+            query["sql"] for query in queries if '"services"' in query["sql"]
+        ]
+        self.assertEqual(len(statements), 2)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                self.assertIn("services_p202608", plan)
+                self.assertNotIn("services_p202607", plan)
+                self.assertNotIn("services_p202609", plan)
+                self.assertNotIn("services_default", plan)
+
+    def test_unique_title_and_service_type(self):
+        """(title, service_type) stays unique across partitions"""
+        self._create_service(
+            "unique", datetime.datetime(2026, 7, 15, tzinfo=datetime.timezone.utc)
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            services_models.Service.objects.create(
+                title="unique",
+                description="description",
+                price=10,
+                tasks=["tasks"],
+                service_type=self.service_type,
+            )
+
+        data = {
+            "title": "unique",
+            "description": "description",
+            "price": 10,
+            "tasks": "tasks",
+            "service_type_id": self.service_type.id,
+        }
+        response = self.client.post(
+            reverse("services"), data=data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_partition_moves_default_rows(self):
+        """rows stored in the default partition move to a new partition"""
+        service = self._create_service(
+            "old", datetime.datetime(2025, 1, 10, tzinfo=datetime.timezone.utc)
+        )
+        partitions.create_partition(datetime.date(2025, 1, 1))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM services_p202501")
+            self.assertEqual(cursor.fetchall(), [(service.id,)])
+            cursor.execute("SELECT count(*) FROM services_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self._create_service("old", timezone.now())
+
+    def test_detach_partitions(self):
+        """old partitions are detached and release their keys"""
+        self._create_service(
+            "detached", datetime.datetime(2026, 7, 15, tzinfo=datetime.timezone.utc)
+        )
+        detached = partitions.detach_partitions(datetime.date(2026, 9, 1))
+        self.assertEqual(detached, ["services_p202607", "services_p202608"])
+        self.assertFalse(services_models.Service.objects.filter(title="detached").exists())
+        self._create_service("detached", timezone.now())
+
+    def test_disable_partitioning(self):
+        """the table goes back to a plain table keeping its rows"""
+        service = self._create_service(
+            "plain", datetime.datetime(2026, 8, 15, tzinfo=datetime.timezone.utc)
+        )
+        partitions.disable()
+        self.assertFalse(partitions.is_partitioned())
+        self.assertTrue(services_models.Service.objects.filter(id=service.id).exists())
+        new_service = self._create_service("plain new", timezone.now())
+        self.assertGreater(new_service.id, service.id)
+
+    def test_indexes_survive_partitioning(self):
+        """the other indexes of the table are recreated on the partitions"""
+        indexes = {"services_tasks_gin", "services_title_prefix"}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_indexes WHERE indexname LIKE 'services_p202608_%'"
+            )
+            # primary key, service type, created_at, tasks and title prefix
+            self.assertEqual(cursor.fetchone()[0], 5)
+            partitions.disable()
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'services'")
+            self.assertLessEqual(indexes, {row[0] for row in cursor.fetchall()})
+
+
+class ServiceArchiveTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(
+            name="archive", active=True
+        )
+        self.services = services_models.Service.objects.bulk_create(
+            [
+                services_models.Service(
+                    title=f"archive {i}",
+                    description="description",
+                    price=10,
+                    tasks=["tasks"],
+                    service_type=self.service_type,
+                    active=i != 0,
+                )
+                for i in range(0, 3)
+            ]
+        )
+        self.archived = self.services[0]
+        services_models.Service.objects.filter(id=self.archived.id).update(
+            updated_at=timezone.now() - datetime.timedelta(days=365)
+        )
+        self.cutoff = timezone.now() - datetime.timedelta(days=90)
+
+    def test_archive_moves_long_inactive_services(self):
+        """only long inactive services are archived"""
+        services_models.Service.objects.filter(id=self.services[1].id).update(
+            active=False
+        )
+        self.assertEqual(archive.archive(self.cutoff, batch_size=1), 1)
+        self.assertFalse(
+            services_models.Service.objects.filter(id=self.archived.id).exists()
+        )
+        archived = services_models.ArchivedService.objects.get(id=self.archived.id)
+        self.assertEqual(archived.title, self.archived.title)
+        self.assertEqual(archived.created_at, self.archived.created_at)
+        self.assertEqual(archive.archive(self.cutoff, batch_size=1), 0)
+
+    def test_archive_in_batches(self):
+        """batches stop at max_batches and resume on the next run"""
+        services_models.Service.objects.update(
+            active=False, updated_at=timezone.now() - datetime.timedelta(days=365)
+        )
+        batches = []
+        moved = archive.archive(
+            self.cutoff, batch_size=1, max_batches=2, on_batch=batches.append
+        )
+        self.assertEqual((moved, batches), (2, [1, 1]))
+        self.assertEqual(archive.archive(self.cutoff, batch_size=10), 1)
+        self.assertFalse(services_models.Service.objects.exists())
+
+    def test_include_archived(self):
+        """archived services are only listed when requested"""
+        archive.archive(self.cutoff, batch_size=10)
+
+        response = self.client.get(reverse("services"))
+        self.assertEqual(response.data["count"], 2)
+
+        response = self.client.get(reverse("services"), {"include_archived": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 3)
+        ids = [service["id"] for service in response.data["data"]]
+        self.assertIn(self.archived.id, ids)
+        self.assertEqual(
+            response.data["data"][ids.index(self.archived.id)]["service_type"]["id"],
+            self.service_type.id,
+        )
+
+        url = reverse("one_service", kwargs={"service_id": self.archived.id})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get(url, {"include_archived": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], self.archived.title)
+
+    def test_reactivate_archived_service(self):
+        """patching an archived service restores it"""
+        archive.archive(self.cutoff, batch_size=10)
+        response = self.client.patch(
+            reverse("one_service", kwargs={"service_id": self.archived.id}),
+            data={"active": True},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["active"])
+        self.assertFalse(
+            services_models.ArchivedService.objects.filter(id=self.archived.id).exists()
+        )
+        service = services_models.Service.objects.get(id=self.archived.id)
+        self.assertEqual(service.created_at, self.archived.created_at)
+
+    def test_invalid_patch_keeps_archived_service(self):
+        """a rejected update does not restore an archived service"""
+        archive.archive(self.cutoff, batch_size=10)
+        response = self.client.patch(
+            reverse("one_service", kwargs={"service_id": self.archived.id}),
+            data={"active": True, "price": "free"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(
+            services_models.ArchivedService.objects.filter(id=self.archived.id).exists()
+        )
+        self.assertFalse(
+            services_models.Service.objects.filter(id=self.archived.id).exists()
+        )
+
+    def test_reactivate_taken_title(self):
+        """an archived service can not be restored over a new one"""
+        archive.archive(self.cutoff, batch_size=10)
+        services_models.Service.objects.create(
+            title=self.archived.title,
+            description="description",
+            price=10,
+            tasks=["tasks"],
+            service_type=self.service_type,
+        )
+        response = self.client.patch(
+            reverse("one_service", kwargs={"service_id": self.archived.id}),
+            data={"active": True},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(
+            services_models.ArchivedService.objects.filter(id=self.archived.id).exists()
+        )
+
+
+class ServiceBulkTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(
+            name="bulk", active=True
+        )
+        for i in range(3):
+            services_models.Service.objects.create(
+                title=f"bulk {i}",
+                description="description, with \"quotes\"\nand lines",
+                price=10 + i,
+                tasks=["paint", "clean"],
+                service_type=self.service_type,
+            )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def _rows(self) -> list:
+        return list(
+            services_models.Service.objects.order_by("title").values_list(
+                "title", "description", "price", "tasks", "service_type__name", "active"
+            )
+        )
+
+    def test_roundtrip(self):
+        """exported service types and services import back in both formats"""
+        expected = self._rows()
+        for format in ("csv", "binary"):
+            types_file = self.directory / f"types.{format}"
+            services_file = self.directory / f"services.{format}"
+            call_command(
+                "export_services", str(types_file), format=format, service_types=True,
+                stdout=io.StringIO(),
+            )
+            call_command(
+                "export_services", str(services_file), format=format, stdout=io.StringIO()
+            )
+            services_models.ServiceType.objects.all().delete()
+
+            output = io.StringIO()
+            call_command(
+                "import_services", str(types_file), format=format, service_types=True,
+                stdout=output,
+            )
+            call_command("import_services", str(services_file), format=format, stdout=output)
+            self.assertIn("3 inserted, 0 updated", output.getvalue())
+            self.assertIn("rows/s", output.getvalue())
+            self.assertEqual(self._rows(), expected)
+            self.assertFalse(
+                services_models.Service.objects.filter(document__isnull=True).exists()
+            )
+
+    def test_upsert(self):
+        """rows of existing services update them, the last duplicate wins"""
+        file = self.directory / "services.csv"
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            'bulk 0,changed,1.5,"[""fix""]",bulk,false,,\n'
+            "bulk 9,new,2,,bulk,,,\n"
+            "bulk 9,newer,3,,bulk,,,\n"
+        )
+        output = io.StringIO()
+        call_command("import_services", str(file), stdout=output)
+        self.assertIn("3 rows read", output.getvalue())
+        self.assertIn("1 inserted, 1 updated", output.getvalue())
+        changed = services_models.Service.objects.get(title="bulk 0")
+        self.assertEqual(
+            (changed.description, changed.price, changed.tasks, changed.active),
+            ("changed", decimal.Decimal("1.5"), ["fix"], False),
+        )
+        self.assertEqual(changed.document, documents.build(changed))
+        new = services_models.Service.objects.get(title="bulk 9")
+        self.assertEqual((new.description, new.tasks, new.active), ("newer", [], True))
+
+        partitions.enable(months_ahead=1)
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            "bulk 1,partitioned,4,[],bulk,true,,\n"
+            "bulk 10,partitioned,5,[],bulk,true,,\n"
+        )
+        output = io.StringIO()
+        call_command("import_services", str(file), skip_documents=True, stdout=output)
+        self.assertIn("1 inserted, 1 updated", output.getvalue())
+        self.assertEqual(
+            services_models.Service.objects.filter(
+                description="partitioned", document__isnull=True
+            ).count(),
+            2,
+        )
+
+    def test_invalid_input(self):
+        """unknown service types and invalid values fail without importing"""
+        file = self.directory / "services.csv"
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            "other,description,1,[],missing,true,,\n"
+        )
+        with self.assertRaisesMessage(CommandError, "unknown service types: missing"):
+            call_command("import_services", str(file), stdout=io.StringIO())
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            "other,description,cheap,[],bulk,true,,\n"
+        )
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            call_command("import_services", str(file), stdout=io.StringIO())
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            "other,description,1,[],bulk,true,,\n"
+            'other 1,description,1,"{""task"": ""paint""}",bulk,true,,\n'
+            "other 2,description,1,[1],bulk,true,,\n"
+        )
+        with self.assertRaisesMessage(
+            CommandError, "tasks must be a list of strings on lines 3, 4"
+        ):
+            call_command("import_services", str(file), stdout=io.StringIO())
+        self.assertFalse(
+            services_models.Service.objects.filter(title__startswith="other").exists()
+        )
+
+    def test_timestamps(self):
+        """imported rows are updated now unless the file timestamps are kept"""
+        file = self.directory / "services.csv"
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            "bulk 0,old,1,[],bulk,true,2020-01-01,2020-01-02\n"
+            "bulk 9,old,1,[],bulk,true,2020-01-01,2020-01-02\n"
+        )
+        call_command("import_services", str(file), stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            now = cursor.fetchone()[0]
+        self.assertEqual(
+            {
+                service.updated_at
+                for service in services_models.Service.objects.filter(description="old")
+            },
+            {now},
+        )
+
+        call_command(
+            "import_services", str(file), keep_timestamps=True, stdout=io.StringIO()
+        )
+        self.assertEqual(
+            {
+                service.updated_at.date()
+                for service in services_models.Service.objects.filter(description="old")
+            },
+            {datetime.date(2020, 1, 2)},
+        )
+
+
+class SimilarServicesTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        index = override_settings(
+            SIMILARITY_INDEX=dict(settings.SIMILARITY_INDEX, DIRECTORY=directory.name)
+        )
+        index.enable()
+        self.addCleanup(index.disable)
+
+        self.painting = services_models.ServiceType.objects.create(
+            name="painting", active=True
+        )
+        self.cars = services_models.ServiceType.objects.create(name="cars", active=True)
+        self.services = {}
+        for title, description, tasks, service_type in (
+            ("house painting", "paint the walls of a house", ["paint walls"], self.painting),
+            ("fence painting", "paint the walls of a fence", ["paint"], self.painting),
+            ("gardening", "water the plants of a garden", ["water plants"], self.painting),
+            ("car painting", "paint the body of a car", ["paint"], self.cars),
+        ):
+            self.services[title] = services_models.Service.objects.create(
+                title=title,
+                description=description,
+                price=10,
+                tasks=tasks,
+                service_type=service_type,
+            )
+
+    def _similar(self, title: str, **params) -> list:
+        response = self.client.get(
+            reverse("similar_services", kwargs={"service_id": self.services[title].id}),
+            params,
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result["service"]["title"] for result in response.data["data"]]
+
+    def test_similar_services(self):
+        """services sharing words are ranked by similarity"""
+        url = reverse(
+            "similar_services", kwargs={"service_id": self.services["house painting"].id}
+        )
+        self.assertEqual(self.client.get(url).status_code, 503)
+
+        call_command("build_similarity_index", stdout=io.StringIO())
+        index = similarity.current()
+        self.assertEqual(len(index), 4)
+        self.assertIsInstance(index.data, np.memmap)
+
+        self.assertEqual(
+            self._similar("house painting"), ["fence painting", "car painting"]
+        )
+        self.assertEqual(self._similar("house painting", same_type="true"), ["fence painting"])
+        self.assertEqual(self._similar("house painting", limit=1), ["fence painting"])
+        response = self.client.get(url, {"limit": 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse("similar_services", kwargs={"service_id": 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_incremental_updates(self):
+        """services written after the build are found without rebuilding"""
+        call_command("build_similarity_index", stdout=io.StringIO())
+        self.services["walls painting"] = services_models.Service.objects.create(
+            title="walls painting",
+            description="paint the walls of a house",
+            price=10,
+            tasks=["paint walls"],
+            service_type=self.painting,
+        )
+        self.assertEqual(self._similar("house painting", limit=1), ["walls painting"])
+        self.assertEqual(self._similar("walls painting", limit=1), ["house painting"])
+
+        response = self.client.delete(
+            reverse("one_service", kwargs={"service_id": self.services["walls painting"].id})
+        )
+        self.assertEqual(response.status_code, 204)
+        self.services["car painting"].delete()
+        self.assertEqual(self._similar("house painting"), ["fence painting"])
+
+    def test_clear_finds_services_with_old_timestamps(self):
+        """services imported with timestamps older than the build are found"""
+        call_command("build_similarity_index", stdout=io.StringIO())
+        self.assertEqual(self._similar("house painting", limit=1), ["fence painting"])
+        file = self.directory / "services.csv"
+        file.write_text(
+            "title,description,price,tasks,service_type,active,created_at,updated_at\n"
+            'walls painting,paint the walls of a house,10,"[""paint walls""]",'
+            "painting,true,2020-01-01,2020-01-01\n"
+            "fence painting,paint the walls of a fence,10,[],painting,false,"
+            "2020-01-01,2020-01-01\n"
+        )
+        call_command(
+            "import_services", str(file), keep_timestamps=True, stdout=io.StringIO()
+        )
+        self.services["walls painting"] = services_models.Service.objects.get(
+            title="walls painting"
+        )
+        self.assertEqual(
+            self._similar("house painting"), ["walls painting", "car painting"]
+        )
+
+    def test_refreshes_run_one_at_a_time(self):
+        """a refresh waits for the running one instead of overwriting its vectors"""
+        call_command("build_similarity_index", stdout=io.StringIO())
+        index = similarity.current()
+        similarity.overlay.refresh(index)
+        with similarity.overlay._refreshing:
+            thread = threading.Thread(target=similarity.overlay.refresh, args=[index])
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_stale_candidates_do_not_shrink_results(self):
+        """services deactivated without signals are replaced by the next ones"""
+        for title in ("wall painting", "door painting", "roof painting"):
+            self.services[title] = services_models.Service.objects.create(
+                title=title,
+                description="paint the walls of a house",
+                price=10,
+                tasks=["paint"],
+                service_type=self.painting,
+            )
+        call_command("build_similarity_index", stdout=io.StringIO())
+        ranked = self._similar("house painting")
+        self.assertEqual(len(ranked), 5)
+        # not published, so the overlay does not know about it
+        services_models.Service.objects.filter(title__in=ranked[:4]).update(active=False)
+        self.assertEqual(self._similar("house painting", limit=2), ranked[4:])
+
+    def test_large_overlay_starts_a_rebuild(self):
+        """past REBUILD_AFTER written services the index is built again"""
+        call_command("build_similarity_index", stdout=io.StringIO())
+        services_models.Service.objects.create(
+            title="walls painting",
+            description="paint the walls of a house",
+            price=10,
+            tasks=["paint walls"],
+            service_type=self.painting,
+        )
+        with mock.patch.object(similarity, "rebuild_in_background") as rebuild:
+            self._similar("house painting")
+            rebuild.assert_not_called()
+            with override_settings(
+                SIMILARITY_INDEX=dict(settings.SIMILARITY_INDEX, REBUILD_AFTER=1)
+            ):
+                self.assertEqual(
+                    self._similar("house painting", limit=1), ["walls painting"]
+                )
+            rebuild.assert_called_once_with()
+
+    def test_rebuild_swaps_the_current_build(self):
+        """a rebuild replaces the current build and prunes the old ones"""
+        first = similarity.build(self.directory)
+        services_models.Service.objects.filter(title="gardening").update(active=False)
+        with override_settings(
+            SIMILARITY_INDEX=dict(
+                settings.SIMILARITY_INDEX, DIRECTORY=str(self.directory), KEEP_BUILDS=1
+            )
+        ):
+            second = similarity.build(self.directory)
+        self.assertEqual((self.directory / "current").resolve(), second)
+        self.assertFalse(first.exists())
+        self.assertEqual(len(similarity.current()), 3)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.painting = services_models.ServiceType.objects.create(
+            name="Painting", active=True
+        )
+        self.services = {}
+        for title, days in (
+            ("Paint a house", 3),
+            ("painting a fence", 1),
+            ("Pool cleaning", 2),
+            ("Gardening", 0),
+        ):
+            self.services[title] = self._create_service(title, days)
+        autocomplete.services.reload()
+        autocomplete.service_types.reload()
+
+    def _create_service(self, title: str, days: int) -> services_models.Service:
+        service = services_models.Service.objects.create(
+            title=title,
+            description="description",
+            price=10,
+            tasks=["task"],
+            service_type=self.painting,
+        )
+        # newest first, updated_at is set on every save
+        services_models.Service.objects.filter(id=service.id).update(
+            updated_at=timezone.now() - datetime.timedelta(days=days)
+        )
+        return service
+
+    def _titles(self, q: str, **params) -> list:
+        response = self.client.get(reverse("autocomplete"), {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [service["title"] for service in response.data["services"]]
+
+    def test_prefix_ranked_by_recency(self):
+        """titles starting with the text, case insensitive, most recent first"""
+        self.assertEqual(
+            self._titles("p"), ["painting a fence", "Pool cleaning", "Paint a house"]
+        )
+        self.assertEqual(self._titles(" PAINT"), ["painting a fence", "Paint a house"])
+        self.assertEqual(self._titles("p", limit=1), ["painting a fence"])
+        self.assertEqual(self._titles("paint a"), ["Paint a house"])
+        self.assertEqual(self._titles("house"), [])
+
+        response = self.client.get(reverse("autocomplete"), {"q": "pa"})
+        self.assertEqual(
+            response.data["service_types"], [{"id": self.painting.id, "name": "Painting"}]
+        )
+
+    def test_writes_update_the_index(self):
+        """created, renamed and deactivated names are seen by the next search"""
+        self.assertEqual(self._titles("g"), ["Gardening"])
+        self._create_service("Grass cutting", 1)
+        self.assertEqual(self._titles("g"), ["Gardening", "Grass cutting"])
+
+        gardening = self.services["Gardening"]
+        gardening.title = "Lawn care"
+        gardening.save()
+        self.assertEqual(self._titles("g"), ["Grass cutting"])
+        self.assertEqual(self._titles("lawn"), ["Lawn care"])
+
+        response = self.client.delete(
+            reverse("one_service", kwargs={"service_id": gardening.id})
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self._titles("lawn"), [])
+
+        self.painting.active = False
+        self.painting.save()
+        response = self.client.get(reverse("autocomplete"), {"q": "pa"})
+        self.assertEqual(response.data["service_types"], [])
+
+    def test_failed_reload_is_retried(self):
+        """changes are kept when reading them fails"""
+        self.assertEqual(self._titles("g"), ["Gardening"])
+        self._create_service("Grass cutting", 1)
+        index = autocomplete.services
+        with mock.patch.object(index, "_rows", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                index.search("g", 5)
+            with self.assertRaises(DatabaseError):
+                index.reload()
+        self.assertTrue(index._everything)
+        index.reload()
+        self.assertEqual(self._titles("g"), ["Gardening", "Grass cutting"])
+
+    def test_reload_keeps_serving_the_names(self):
+        """searches during a reload use the previous names without waiting"""
+        self.assertEqual(self._titles("g"), ["Gardening"])
+        index = autocomplete.services
+        with index._reloading:
+            index.clear()
+            self._create_service("Grass cutting", 1)
+            with mock.patch.object(index, "_rows", side_effect=DatabaseError):
+                self.assertEqual(self._titles("g"), ["Gardening"])
+
+        rows = [(0, "Garage doors", timezone.now())]
+        with mock.patch.object(index, "_rows", return_value=rows):
+            self.assertTrue(index.reload_in_background())
+            with index._reloading:
+                pass
+        self.assertEqual(self._titles("g"), ["Garage doors"])
+
+    def test_database_backend(self):
+        """the database backend answers like the index, through the prefix index"""
+        with override_settings(
+            AUTOCOMPLETE=dict(settings.AUTOCOMPLETE, BACKEND="database")
+        ):
+            self.assertEqual(
+                self._titles("p"), ["painting a fence", "Pool cleaning", "Paint a house"]
+            )
+            self.assertEqual(self._titles("PAINT"), ["painting a fence", "Paint a house"])
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = services_models.Service.objects.filter(
+                title__istartswith="paint"
+            ).explain()
+        # the index, or the ones of the partitions, searches the prefix range
+        self.assertRegex(plan, r"Index Scan using \w+ on services")
+        self.assertIn("Index Cond: ((upper((title)::text) ~>=~ 'PAINT'::text)", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_invalid_params(self):
+        """the text is required and the limit bounded"""
+        self.assertEqual(self.client.get(reverse("autocomplete")).status_code, 400)
+        response = self.client.get(reverse("autocomplete"), {"q": ""})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse("autocomplete"),
+            {"q": "p", "limit": settings.AUTOCOMPLETE["MAX_LIMIT"] + 1},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ServiceBatchViewTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        service_type = services_models.ServiceType.objects.create(
+            name="batch", active=True
+        )
+        self.services = [
+            services_models.Service.objects.create(
+                title=f"batch {i}",
+                description="description",
+                price=10,
+                tasks=["tasks"],
+                service_type=service_type,
+                active=i != 0,
+            )
+            for i in range(0, 3)
+        ]
+        self.inactive, self.first, self.second = self.services
+        self.missing_id = self.second.id + 100
+
+    def test_get_many_services(self):
+        """services keep the requested order in one query"""
+        ids = [self.second.id, self.missing_id, self.first.id, self.inactive.id]
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("batch_services"), {"ids": ",".join(map(str, ids))}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [service["id"] for service in response.data["data"]],
+            [self.second.id, self.first.id],
+        )
+        self.assertEqual(
+            response.data["data"][0]["service_type"]["id"],
+            self.second.service_type_id,
+        )
+        self.assertEqual(response.data["missing"], [self.missing_id])
+        self.assertEqual(response.data["inactive"], [self.inactive.id])
+
+    def test_get_many_cached_services(self):
+        """services already cached by the detail view are not queried again"""
+        self.client.get(reverse("one_service", kwargs={"service_id": self.first.id}))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse("batch_services"), {"ids": str(self.first.id)}
+            )
+        self.assertEqual(response.data["data"][0]["id"], self.first.id)
+
+        ids = f"{self.first.id},{self.second.id}"
+        with self.assertNumQueries(1):
+            self.client.get(reverse("batch_services"), {"ids": ids})
+        with self.assertNumQueries(0):
+            self.client.get(reverse("batch_services"), {"ids": ids})
+
+    def test_post_many_services(self):
+        """ids can be sent in the request body"""
+        response = self.client.post(
+            reverse("batch_services"),
+            data={"ids": [self.first.id, self.second.id, self.first.id]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [service["id"] for service in response.data["data"]],
+            [self.first.id, self.second.id],
+        )
+
+    def test_invalid_ids(self):
+        """ids must be a non empty list of positive integers under the limit"""
+        response = self.client.get(reverse("batch_services"), {"ids": "1,a"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("batch_services"))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse("batch_services"),
+            data={"ids": list(range(1, 1000))},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        for body in ([self.first.id], 1, "ids"):
+            response = self.client.post(
+                reverse("batch_services"), data=body, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class SingleFlightTests(TestCase):
+    def test_threads_share_one_call(self):
+        """concurrent threads with the same key run the function once"""
+        flight = SingleFlight("test", timeout=5)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"count": 1}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(flight.do, "key", compute)
+            started.wait(5)
+            followers = [executor.submit(flight.do, "key", compute) for _ in range(3)]
+            while flight.stats()["coalesced"] < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [future.result() for future in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(
+            flight.stats(), {"leaders": 1, "coalesced": 3, "timeouts": 0, "errors": 0}
+        )
+
+    def test_errors_reach_waiting_callers(self):
+        """the leader error is raised to the coalesced callers"""
+        flight = SingleFlight("test", timeout=5)
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, "key", compute)
+            started.wait(5)
+            follower = executor.submit(flight.do, "key", compute)
+            while flight.stats()["coalesced"] < 1:
+                time.sleep(0.001)
+            release.set()
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(flight.stats()["errors"], 1)
+        self.assertEqual(flight.do("key", lambda: "retried"), "retried")
+
+    def test_timeout_runs_the_call(self):
+        """a caller waiting longer than the timeout runs the function itself"""
+        flight = SingleFlight("test", timeout=0.01)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return "leader"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(flight.do, "key", slow)
+            started.wait(5)
+            with self.assertLogs("gigflow.coalescing", "WARNING"):
+                self.assertEqual(flight.do("key", lambda: "own"), "own")
+            release.set()
+            self.assertEqual(leader.result(), "leader")
+        self.assertEqual(flight.stats()["timeouts"], 1)
+
+    def test_stats_logged(self):
+        """the counters are logged once per interval"""
+        flight = SingleFlight("test", timeout=5, stats_interval=0)
+        with self.assertLogs("gigflow.coalescing", "INFO") as logs:
+            flight.do("key", lambda: "result")
+        self.assertIn("'leaders': 1", logs.output[0])
+
+    def test_list_key(self):
+        """list requests are identified by their filters and page"""
+        service_type = services_models.ServiceType.objects.create(name="flight")
+        services_models.Service.objects.create(
+            title="flight",
+            description="description",
+            price=10,
+            tasks=["tasks"],
+            service_type=service_type,
+        )
+        leaders = services_views.services_list_flight.stats()["leaders"]
+        response = self.client.get(
+            reverse("services"), {"title": "flight", "page": 1, "ignored": "x"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(
+            services_views.services_list_flight.stats()["leaders"], leaders + 1
+        )
+
+        view = services_views.ServiceView()
+        keys = []
+        for wsgi_request in (
+            response.wsgi_request,
+            self.client.get(reverse("services"), {"page": 1, "title": "flight"}).wsgi_request,
+        ):
+            request = view.initialize_request(wsgi_request)
+            keys.append(
+                view._get_list_key(request, view.filter_set.compile(request.query_params))
+            )
+        self.assertEqual(keys[0], keys[1])
+
+    def test_shared_page_links(self):
+        """a page shared between identical requests links to each request url"""
+        service_type = services_models.ServiceType.objects.create(name="flight")
+        for title in ("first", "second", "third"):
+            services_models.Service.objects.create(
+                title=title,
+                description="description",
+                price=10,
+                tasks=["tasks"],
+                service_type=service_type,
+            )
+        shared = self.client.get(
+            reverse("services"), {"page": 2, "page_size": 1, "leader": "x"}
+        ).data
+        self.assertIn("leader=x", shared["next_page_url"])
+
+        view = services_views.ServiceView()
+        view.request = view.initialize_request(
+            self.client.get(
+                reverse("services"), {"page_size": 1, "page": 2, "follower": "y"}
+            ).wsgi_request
+        )
+        data = view.paginator.relink(view.request, shared)
+        self.assertEqual(data["data"], shared["data"])
+        self.assertIn("follower=y", data["next_page_url"])
+        self.assertIn("page=3", data["next_page_url"])
+        self.assertNotIn("leader", data["next_page_url"])
+        self.assertIn("follower=y", data["last_page_url"])
+        self.assertNotIn("page=", data["last_page_url"].replace("page_size", ""))
+
+
+class ServiceDocumentTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(
+            name="document", active=True
+        )
+        self.service = services_models.Service.objects.create(
+            title="document",
+            description="description",
+            price=10,
+            tasks=["tasks"],
+            service_type=self.service_type,
+        )
+
+    def _serialized(self) -> dict:
+        service = services_models.Service.objects.select_related("service_type").get(
+            id=self.service.id
+        )
+        return services_serializers.ServiceSerializer(service).data
+
+    def test_document_matches_serializer(self):
+        """the stored document is the serializer output"""
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.document, self._serialized())
+        self.assertNotIn("document", self.service.document)
+
+        response = self.client.get(
+            reverse("one_service", kwargs={"service_id": self.service.id})
+        )
+        self.assertEqual(response.data, self._serialized())
+        response = self.client.get(reverse("services"))
+        self.assertEqual(response.data["data"], [self._serialized()])
+
+    def test_list_skips_serializer(self):
+        """list pages are read from the stored documents"""
+        services_models.Service.objects.filter(id=self.service.id).update(
+            document={"id": self.service.id, "stored": True}
+        )
+        response = self.client.get(reverse("services"))
+        self.assertEqual(response.data["data"], [{"id": self.service.id, "stored": True}])
+
+    def test_missing_document_is_serialized(self):
+        """services without a document are serialized on read"""
+        services_models.Service.objects.update(document=None)
+        response = self.client.get(reverse("services"))
+        self.assertEqual(response.data["data"], [self._serialized()])
+        self.assertEqual(documents.check(services_models.Service.objects.all()), [self.service.id])
+
+    def test_service_type_change_updates_documents(self):
+        """renaming a service type updates the nested document"""
+        response = self.client.patch(
+            reverse("one_service_type", kwargs={"service_type_id": self.service_type.id}),
+            data={"name": "renamed"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.document["service_type"]["name"], "renamed")
+        self.assertEqual(documents.check(services_models.Service.objects.all()), [])
+
+    def test_rebuild_documents(self):
+        """rebuild restores stale documents"""
+        services_models.Service.objects.update(title="stale")
+        queryset = services_models.Service.objects.all()
+        self.assertEqual(documents.check(queryset), [self.service.id])
+        self.assertEqual(documents.rebuild(queryset, batch_size=1), 1)
+        self.assertEqual(documents.check(queryset), [])
+        self.assertEqual(
+            self.client.get(reverse("services")).data["data"][0]["title"], "stale"
+        )
+
+
+PROFILING = {
+    "ENABLED": True,
+    "URL_NAMES": ["services", "service_types"],
+    "QUERY_PARAM": "profile",
+    "TRUSTED_IPS": ["127.0.0.1"],
+    "TOKEN": "secret",
+    "OUTPUT_DIR": None,
+    "SAMPLE_RATE": 0,
+    "SAMPLE_FORMAT": "collapsed",
+}
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def _artifact(self, response) -> zipfile.ZipFile:
+        self.assertEqual(response["Content-Type"], "application/zip")
+        return zipfile.ZipFile(io.BytesIO(response.content))
+
+    @override_settings(PROFILING=PROFILING)
+    def test_download_pstats_profile(self):
+        """a trusted caller gets the profile and the executed SQL"""
+        response = self.client.get(reverse("service_types"), {"profile": "pstats"})
+        artifact = self._artifact(response)
+        self.assertEqual(
+            sorted(artifact.namelist()),
+            ["profile.pstats", "queries.json", "request.json"],
+        )
+        queries = json.loads(artifact.read("queries.json"))
+        self.assertTrue(any("service_types" in query["sql"] for query in queries))
+        self.assertEqual(json.loads(artifact.read("request.json"))["status"], 200)
+
+    @override_settings(PROFILING=PROFILING)
+    def test_download_collapsed_profile(self):
+        """the header asks for a collapsed stack profile"""
+        response = self.client.get(reverse("services"), HTTP_X_PROFILE="collapsed")
+        self.assertIn("profile.collapsed", self._artifact(response).namelist())
+
+    @override_settings(PROFILING=PROFILING)
+    def test_untrusted_caller(self):
+        """untrusted callers get the regular response unless they send the token"""
+        response = self.client.get(
+            reverse("services"), {"profile": "pstats"}, REMOTE_ADDR="10.0.0.1"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("data", response.data)
+
+        response = self.client.get(
+            reverse("services"),
+            {"profile": "pstats"},
+            REMOTE_ADDR="10.0.0.1",
+            HTTP_X_PROFILE_TOKEN="secret",
+        )
+        self._artifact(response)
+
+    @override_settings(PROFILING=dict(PROFILING, ENABLED=False))
+    def test_disabled(self):
+        """profiling flags are ignored when disabled"""
+        response = self.client.get(reverse("services"), {"profile": "pstats"})
+        self.assertIn("data", response.data)
+
+    def test_sampled_requests_are_stored(self):
+        """one in SAMPLE_RATE requests of every endpoint is stored"""
+        with tempfile.TemporaryDirectory() as output_dir:
+            config = dict(PROFILING, SAMPLE_RATE=2, OUTPUT_DIR=output_dir)
+            with override_settings(PROFILING=config), self.assertLogs(
+                "gigflow.profiling", "INFO"
+            ) as logs:
+                for _ in range(0, 3):
+                    response = self.client.get(reverse("services"))
+                    self.assertEqual(response.status_code, 200)
+                self.client.get(reverse("service_types"))
+            stored = sorted(path.name for path in Path(output_dir).iterdir())
+        self.assertEqual(len(stored), 3)
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(len([name for name in stored if name.startswith("services-")]), 2)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        slow_queries.log.reset()
+        self.log_file = Path(tempfile.mkdtemp()) / "slow_queries.jsonl"
+        self.config = {
+            "ENABLED": True,
+            "DATABASES": ["default"],
+            "THRESHOLD_MS": 0,
+            "EXPLAIN": True,
+            "ANALYZE": True,
+            "RATE_LIMIT_SECONDS": 300,
+            "LOG_FILE": str(self.log_file),
+        }
+        # keep the list queries on django's SQL instead of prepared statements
+        prepared = override_settings(
+            PREPARED_STATEMENTS=dict(settings.PREPARED_STATEMENTS, ENABLED=False)
+        )
+        prepared.enable()
+        self.addCleanup(prepared.disable)
+
+    def _records(self) -> list:
+        return [json.loads(line) for line in self.log_file.read_text().splitlines()]
+
+    def test_normalize(self):
+        """literals and IN list lengths do not change the fingerprint"""
+        self.assertEqual(
+            slow_queries.normalize("SELECT *  FROM t WHERE id IN (%s, %s) AND a = 'x' AND b > 10"),
+            "SELECT * FROM t WHERE id IN (...) AND a = ? AND b > ?",
+        )
+        self.assertEqual(
+            slow_queries.normalize("SELECT * FROM t WHERE id IN (%s)"),
+            slow_queries.normalize("SELECT * FROM t WHERE id IN (%s, %s, %s)"),
+        )
+        self.assertEqual(
+            slow_queries.normalize('SAVEPOINT "s140234_x1"'),
+            slow_queries.normalize('SAVEPOINT "s139871_x12"'),
+        )
+        self.assertEqual(
+            slow_queries.normalize('RELEASE SAVEPOINT "s140234_x1"'),
+            'RELEASE SAVEPOINT "?"',
+        )
+
+    def test_capture_slow_list_queries(self):
+        """slow queries are logged with their view and plan, once per fingerprint"""
+        params = {"title": "slow", "minimum_price": 1, "maximum_price": 100}
+        with self.assertLogs("gigflow.slow_queries", "WARNING"), override_settings(
+            SLOW_QUERIES=self.config
+        ):
+            self.client.get(reverse("services"), params)
+            self.client.get(reverse("services"), params)
+
+        records = self._records()
+        fingerprints = [record["fingerprint"] for record in records]
+        self.assertEqual(len(fingerprints), len(set(fingerprints)))
+        count = next(record for record in records if "COUNT(*)" in record["sql"])
+        self.assertEqual(count["view"], "GET services.views.services.ServiceView")
+        self.assertEqual(count["skipped"], 0)
+        self.assertEqual(count["params"], ["%slow%", "1", "100"])
+        self.assertIn("Execution Time", count["plan"])
+        self.assertIn("UPPER", count["sql"])
+
+        with self.assertLogs("gigflow.slow_queries", "WARNING"), override_settings(
+            SLOW_QUERIES=dict(self.config, RATE_LIMIT_SECONDS=0)
+        ):
+            self.client.get(reverse("services"), params)
+        records = self._records()
+        self.assertEqual(
+            [record["skipped"] for record in records if record["fingerprint"] == count["fingerprint"]],
+            [0, 1],
+        )
+
+        output = io.StringIO()
+        call_command("slow_queries", file=str(self.log_file), plans=True, stdout=output)
+        self.assertIn(count["fingerprint"], output.getvalue())
+        self.assertIn("count=3", output.getvalue())
+        self.assertIn("Execution Time", output.getvalue())
+
+    def test_explain_without_side_effects(self):
+        """statements with side effects or locks are not run again"""
+        wrapper = slow_queries.SlowQueryWrapper("test")
+        with override_settings(SLOW_QUERIES=self.config):
+            plan = wrapper.explain(
+                "SELECT id FROM services WHERE title = 'x'", (), connection
+            )
+            self.assertIn("Execution Time", plan)
+            for sql, params in (
+                ("SELECT pg_notify(%s, %s)", ["slow_query_test", "payload"]),
+                ("SELECT id FROM services FOR UPDATE SKIP LOCKED", ()),
+                ("SELECT nextval('services_id_seq')", ()),
+                ("EXECUTE other_statement", ()),
+            ):
+                plan = wrapper.explain(sql, params, connection)
+                self.assertNotIn("Execution Time", plan or "")
+        with override_settings(SLOW_QUERIES=dict(self.config, ANALYZE=False)):
+            plan = wrapper.explain("SELECT id FROM services", (), connection)
+            self.assertIn("Seq Scan", plan)
+            self.assertNotIn("Execution Time", plan)
+
+    def test_disabled(self):
+        """nothing is captured when disabled"""
+        with override_settings(SLOW_QUERIES=dict(self.config, ENABLED=False)):
+            self.client.get(reverse("services"))
+        self.assertFalse(self.log_file.exists())
+
+
+class LocalCacheTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = invalidation.LocalCache("test", max_size=2, ttl=60)
+
+    def test_lru(self):
+        """the least recently used entry is dropped over max_size"""
+        self.cache.set(1, "a")
+        self.cache.set(2, "b")
+        self.cache.get(1)
+        self.cache.set(3, "c")
+        self.assertEqual(
+            [self.cache.get(key) for key in (1, 2, 3)], ["a", None, "c"]
+        )
+
+    def test_ttl(self):
+        """expired entries are not returned"""
+        self.cache.ttl = -1
+        self.cache.set(1, "a")
+        self.assertIsNone(self.cache.get(1))
+
+    def test_dispatch(self):
+        """changes evict the ids of the model or the whole cache"""
+        invalidation.register(self.cache, "tests.model")
+        invalidation.register(self.cache, "tests.parent", evict_all=True)
+        self.cache.set(1, "a")
+        self.cache.set(2, "b")
+        invalidation.dispatch({"model": "tests.model", "ids": [1]})
+        self.assertEqual([self.cache.get(1), self.cache.get(2)], [None, "b"])
+        invalidation.dispatch({"model": "tests.parent", "ids": [10]})
+        self.assertEqual(len(self.cache), 0)
+
+
+class ServiceDocumentCacheTests(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.service_type = services_models.ServiceType.objects.create(name="cache")
+        self.service = services_models.Service.objects.create(
+            title="cache",
+            description="description",
+            price=10,
+            tasks=["tasks"],
+            service_type=self.service_type,
+        )
+        self.url = reverse("one_service", kwargs={"service_id": self.service.id})
+
+    def test_detail_is_cached(self):
+        """a cached detail does not query the database"""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["title"], "cache")
+
+    def test_writes_evict_the_cache(self):
+        """patching a service or its service type evicts the cached detail"""
+        self.client.get(self.url)
+        self.client.patch(self.url, data={"title": "patched"}, content_type="application/json")
+        self.assertEqual(self.client.get(self.url).data["title"], "patched")
+
+        self.client.patch(
+            reverse("one_service_type", kwargs={"service_type_id": self.service_type.id}),
+            data={"name": "renamed"},
+            content_type="application/json",
+        )
+        self.assertEqual(self.client.get(self.url).data["service_type"]["name"], "renamed")
+
+        self.client.delete(self.url)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class InvalidationListenerTests(TransactionTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = invalidation.register(
+            invalidation.LocalCache("listener", max_size=10, ttl=60), "tests.listened"
+        )
+
+    def _listen(self, mode: str) -> invalidation.Listener:
+        listener = invalidation.Listener(mode, "gigflow_test", 0.01, 3600)
+        listener.connect()
+        self.addCleanup(listener.close)
+        return listener
+
+    def _receive(self, listener: invalidation.Listener) -> int:
+        # the local eviction of publish is undone to see the listener one
+        self.cache.set(1, "a")
+        received = 0
+        for _ in range(0, 100):
+            received += listener.poll(0.05)
+            if received:
+                break
+        return received
+
+    def test_notify(self):
+        """changes are received with LISTEN/NOTIFY after the commit"""
+        listener = self._listen("notify")
+        config = dict(settings.CACHE_INVALIDATION, MODE="notify", CHANNEL="gigflow_test")
+        with override_settings(CACHE_INVALIDATION=config):
+            invalidation.publish("tests.listened", [1])
+        received = invalidation.stats()["received"]
+        self.assertEqual(self._receive(listener), 1)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(invalidation.stats()["received"], received + 1)
+        self.assertGreaterEqual(invalidation.stats()["lag_ms_last"], 0)
+
+    def test_poll(self):
+        """changes are read from the cache_invalidations table"""
+        listener = self._listen("poll")
+        config = dict(settings.CACHE_INVALIDATION, MODE="poll")
+        with override_settings(CACHE_INVALIDATION=config):
+            invalidation.publish("tests.listened", [1])
+        self.assertEqual(self._receive(listener), 1)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(listener.poll(0), 0)
+
+    def test_poll_out_of_order_commits(self):
+        """a row committed after a later one is still read"""
+        listener = self._listen("poll")
+        table = invalidations_models.CacheInvalidation._meta.db_table
+        wrapper = connections["default"]
+        other = wrapper.Database.connect(**wrapper.get_connection_params())
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (payload, created_at) VALUES (%s, now()) "
+                "RETURNING id",
+                [
+                    json.dumps(
+                        {"model": "tests.listened", "ids": [2], "sent_at": time.time()}
+                    )
+                ],
+            )
+            uncommitted = cursor.fetchone()[0]
+        invalidations_models.CacheInvalidation.objects.create(
+            payload={"model": "tests.listened", "ids": [1], "sent_at": time.time()}
+        )
+        self.assertEqual(self._receive(listener), 1)
+        self.assertIsNone(self.cache.get(1))
+        self.assertIn(uncommitted, listener.gaps)
+
+        other.commit()
+        self.cache.set(2, "b")
+        self.assertEqual(listener.poll(0), 1)
+        self.assertIsNone(self.cache.get(2))
+        self.assertNotIn(uncommitted, listener.gaps)
+        self.assertEqual(listener.poll(0), 0)
+
+    def test_log_stats(self):
+        """the counters are logged at most once per interval"""
+        listener = invalidation.Listener("notify", "gigflow_test", 0.01, 3600, stats_interval=60)
+        with self.assertNoLogs("services.invalidation", "INFO"):
+            listener.log_stats()
+        listener._logged_at -= 60
+        with self.assertLogs("services.invalidation", "INFO") as logs:
+            listener.log_stats()
+            listener.log_stats()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("'received':", logs.output[0])
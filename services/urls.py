@@ -6,11 +6,22 @@ from services.views import services as services_views
 
 urlpatterns = [
     path("", services_views.ServiceView.as_view(), name="services"),
+    path("batch/", services_views.ServiceBatchView.as_view(), name="batch_services"),
+    path(
+        "autocomplete/",
+        services_views.AutocompleteView.as_view(),
+        name="autocomplete",
+    ),
     path(
         "<int:service_id>/",
         services_views.SeriviceOneView.as_view(),
         name="one_service",
     ),
+    path(
+        "<int:service_id>/similar/",
+        services_views.SimilarServicesView.as_view(),
+        name="similar_services",
+    ),
     path(
         "service-types/", services_views.ServiceTypeView.as_view(), name="service_types"
     ),
@@ -1,5 +1,7 @@
 # Django
-from django.db.models import Q
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q, prefetch_related_objects
 
 # Django REST Framework
 from rest_framework.request import Request
@@ -14,18 +16,92 @@ from services.models import services as services_models
 # Serializers
 from services.serializers import services as services_serializers
 
+# Archive
+from services import archive
+
+# Documents
+from services import documents
+
+# Caches
+from services import invalidation
+
+# Similarity
+from services import similarity
+
+# Autocomplete
+from services import autocomplete
+
+# Coalescing
+from gigflow.coalescing import SingleFlight
+
+# Filters
+from gigflow.filters import (
+    CompiledFilters,
+    Filter,
+    FilterSet,
+    parse_bool,
+    parse_datetime,
+    parse_decimal,
+    parse_int,
+    parse_str,
+)
+
+# Prepared statements
+from gigflow.prepared import PreparedQueries
+
 # Docs
 from gigflow.drf_spectacular import views_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+
+include_archived_parameter = OpenApiParameter(
+    "include_archived",
+    OpenApiTypes.BOOL,
+    OpenApiParameter.QUERY,
+    description="Include archived services",
+)
+
+
+def include_archived(params: dict) -> bool:
+    """check if the archived services were requested"""
+    return params.get("include_archived") == "true"
+
+
+services_list_flight = SingleFlight(
+    "services_list",
+    timeout=settings.SINGLE_FLIGHT["TIMEOUT"],
+    stats_interval=settings.SINGLE_FLIGHT["STATS_INTERVAL"],
+)
+
+# prepared statements of the hot filter combinations of the services list
+services_list_statements = PreparedQueries("services_list")
+
+# documents of active services by id, evicted through the invalidation bus
+service_documents = invalidation.register(
+    invalidation.LocalCache(
+        "service_documents",
+        max_size=settings.SERVICE_DOCUMENT_CACHE["MAX_SIZE"],
+        ttl=settings.SERVICE_DOCUMENT_CACHE["TTL"],
+    ),
+    "services.service",
+)
+invalidation.register(service_documents, "services.servicetype", evict_all=True)
 
 
 class ServiceTypeView(GenericAPIView):
 
     serializer_class = services_serializers.ServiceTypeSerializer
+    filter_set = FilterSet(
+        services_models.ServiceType,
+        Filter("active", "active", "exact", parse_bool),
+        Filter("name", "name", "icontains", parse_str, "Part of the name"),
+    )
 
     @views_schema.get_many_schema(
+        parameters=filter_set.parameters(),
         responses={
             200: services_serializers.ServiceTypeSerializer(many=True),
-        }
+        },
     )
     def get(self, request: Request) -> Response:
         """get all service types"""
@@ -58,13 +134,7 @@ class ServiceTypeView(GenericAPIView):
         Returns:
             Q: filters
         """
-        filters = Q()
-        if "active" in params:
-            active = True if params["active"] == "true" else False
-            filters &= Q(active=active)
-        if "name" in params:
-            filters &= Q(name__icontains=params["name"])
-        return filters
+        return self.filter_set.compile(params).q
 
 
 class ServiceTypeOneView(GenericAPIView):
@@ -118,22 +188,76 @@ class ServiceTypeOneView(GenericAPIView):
 class ServiceView(GenericAPIView):
 
     serializer_class = services_serializers.ServiceSerializer
+    filter_set = FilterSet(
+        services_models.Service,
+        Filter("active", "active", "exact", parse_bool),
+        Filter("title", "title", "icontains", parse_str, "Part of the title"),
+        Filter(
+            "task",
+            "tasks",
+            "contains",
+            parse_str,
+            "Task of the service",
+            wrap=lambda task: [task],
+        ),
+        Filter("service_type", "service_type", "exact", parse_int, "Service type id"),
+        Filter("minimum_price", "price", "gte", parse_decimal),
+        Filter("maximum_price", "price", "lte", parse_decimal),
+        Filter("start_date", "created_at", "gte", parse_datetime, "Created from"),
+        Filter(
+            "end_date",
+            "created_at",
+            "lte",
+            parse_datetime,
+            "Created until, only with start_date",
+            requires="start_date",
+        ),
+    )
 
     @views_schema.get_many_schema(
+        parameters=[include_archived_parameter, *filter_set.parameters()],
         responses={
             200: services_serializers.ServiceSerializer(many=True),
-        }
+        },
     )
     def get(self, request: Request) -> Response:
         """get all services"""
-        queryset = (
-            services_models.Service.objects.select_related("service_type")
-            .filter(self._get_filters(request.query_params))
+        filters = self.filter_set.compile(request.query_params)
+        if not settings.SINGLE_FLIGHT["ENABLED"]:
+            return self._list(request, filters)
+        data = services_list_flight.do(
+            self._get_list_key(request, filters),
+            lambda: self._list(request, filters).data,
+        )
+        # the links of a shared page point to the url of the first request
+        return Response(self.paginator.relink(request, data), status=status.HTTP_200_OK)
+
+    def _list(self, request: Request, filters: CompiledFilters) -> Response:
+        """get a page of services"""
+        if include_archived(request.query_params):
+            queryset = (
+                services_models.Service.objects.filter(filters.q)
+                .union(
+                    services_models.ArchivedService.objects.filter(filters.q).defer(
+                        "archived_at"
+                    ),
+                    all=True,
+                )
+                .order_by("-created_at")
+            )
+            page = self.paginate_queryset(queryset)
+            prefetch_related_objects(page, "service_type")
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        rows = services_list_statements.query(
+            filters.shape,
+            filters.db_params(connection),
+            lambda: services_models.Service.objects.filter(filters.q)
             .order_by("-created_at")
+            .values_list("id", "document"),
         )
-        page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(documents.render(page))
 
     @views_schema.base_schema(
         request=services_serializers.ServiceSerializer,
@@ -149,6 +273,24 @@ class ServiceView(GenericAPIView):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def _get_list_key(self, request: Request, filters: CompiledFilters) -> tuple:
+        """identify identical list requests
+
+        Args:
+            request (Request): list request
+            filters (CompiledFilters): filters of the request
+        Returns:
+            tuple: url, canonical filters and the params of the page
+        """
+        params = request.query_params
+        return (
+            request.build_absolute_uri(request.path),
+            filters.key,
+            include_archived(params),
+            params.get("page"),
+            params.get("page_size"),
+        )
+
     def _get_filters(self, params: dict) -> Q:
         """get filters from query params
 
@@ -158,24 +300,171 @@ class ServiceView(GenericAPIView):
         Returns:
             Q: filters
         """
-        filters = Q()
-        if "active" in params:
-            active = True if params["active"] == "true" else False
-            filters &= Q(active=active)
-        if "title" in params:
-            filters &= Q(title__icontains=params["title"])
-        if "service_type" in params:
-            filters &= Q(service_type__id=params["service_type"])
-        if "minimum_price" in params:
-            filters &= Q(price__gte=params["minimum_price"])
-        if "maximum_price" in params:
-            filters &= Q(price__lte=params["maximum_price"])
-        if start_date := params.get("start_date"):
-            if end_date := params.get("end_date"):
-                filters &= Q(created_at__range=[start_date, end_date])
-            else:
-                filters &= Q(created_at__gte=start_date)
-        return filters
+        return self.filter_set.compile(params).q
+
+
+class ServiceBatchView(GenericAPIView):
+
+    serializer_class = services_serializers.ServiceBatchSerializer
+
+    @views_schema.base_schema(
+        parameters=[
+            OpenApiParameter(
+                "ids",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                required=True,
+                description="Comma separated service ids",
+            )
+        ],
+        responses={
+            200: services_serializers.ServiceBatchResponseSerializer,
+        },
+    )
+    def get(self, request: Request) -> Response:
+        """get many services by id"""
+        ids = [id for id in request.query_params.get("ids", "").split(",") if id]
+        return self._get_many({"ids": ids})
+
+    @views_schema.base_schema(
+        request=services_serializers.ServiceBatchSerializer,
+        responses={
+            200: services_serializers.ServiceBatchResponseSerializer,
+        },
+    )
+    def post(self, request: Request) -> Response:
+        """get many services by id"""
+        return self._get_many(request.data)
+
+    def _get_many(self, data) -> Response:
+        """fetch the active services of a list of ids in one query
+
+        Args:
+            data: body with the requested ids, in the response order
+        Returns:
+            Response: found services, missing and inactive ids
+        """
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data["ids"]))
+
+        found = {id: service_documents.get(id) for id in ids}
+        pending = [id for id in ids if found[id] is None]
+        services = {}
+        if pending:
+            services = {
+                id: (active, document)
+                for id, active, document in services_models.Service.objects.filter(
+                    id__in=pending
+                ).values_list("id", "active", "document")
+            }
+        rows = [
+            (id, services[id][1]) for id in pending if services.get(id, (False,))[0]
+        ]
+        for (id, _), document in zip(rows, documents.render(rows)):
+            found[id] = document
+            service_documents.set(id, document)
+        return Response(
+            {
+                "data": [found[id] for id in ids if found[id] is not None],
+                "missing": [id for id in pending if id not in services],
+                "inactive": [
+                    id for id in pending if id in services and not services[id][0]
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class SimilarityIndexUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The similarity index has not been built"
+    default_code = "similarity_index_unavailable"
+
+
+class SimilarServicesView(GenericAPIView):
+
+    serializer_class = services_serializers.SimilarServicesSerializer
+
+    @views_schema.base_schema(
+        parameters=[services_serializers.SimilarServicesSerializer],
+        responses={
+            200: services_serializers.SimilarServicesResponseSerializer,
+        },
+    )
+    def get(self, request: Request, service_id: int) -> Response:
+        """get the active services most similar to a service"""
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        limit = serializer.validated_data["limit"]
+        index = similarity.current()
+        if index is None:
+            raise SimilarityIndexUnavailable()
+        rows = {}
+
+        def available(ids: list) -> set:
+            # services archived or deleted outside of the models may still be indexed
+            rows.update(
+                services_models.Service.objects.filter(
+                    id__in=[id for id in ids if id not in rows], active=True
+                ).values_list("id", "document")
+            )
+            return rows.keys()
+
+        results = similarity.similar(
+            index,
+            service_id,
+            limit,
+            same_type=serializer.validated_data["same_type"],
+            available=available,
+        )
+        if results is None:
+            raise exceptions.NotFound("Service not found")
+        rendered = documents.render([(id, rows[id]) for id, _ in results])
+        return Response(
+            {
+                "data": [
+                    {"score": round(score, 6), "service": document}
+                    for (_, score), document in zip(results, rendered)
+                ]
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class AutocompleteView(GenericAPIView):
+
+    serializer_class = services_serializers.AutocompleteSerializer
+
+    @views_schema.base_schema(
+        parameters=[services_serializers.AutocompleteSerializer],
+        responses={
+            200: services_serializers.AutocompleteResponseSerializer,
+        },
+    )
+    def get(self, request: Request) -> Response:
+        """get the most recent active services and service types starting with a text"""
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        prefix = serializer.validated_data["q"]
+        limit = serializer.validated_data["limit"]
+        return Response(
+            {
+                "services": [
+                    {"id": id, "title": title}
+                    for id, title in autocomplete.search(
+                        autocomplete.services, prefix, limit
+                    )
+                ],
+                "service_types": [
+                    {"id": id, "name": name}
+                    for id, name in autocomplete.search(
+                        autocomplete.service_types, prefix, limit
+                    )
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
 
 
 class SeriviceOneView(GenericAPIView):
@@ -183,15 +472,30 @@ class SeriviceOneView(GenericAPIView):
     serializer_class = services_serializers.ServiceSerializer
 
     @views_schema.base_schema(
+        parameters=[include_archived_parameter],
         responses={
             200: services_serializers.ServiceSerializer,
-        }
+        },
     )
     def get(self, request: Request, service_id: int) -> Response:
         """get a service"""
-        queryset = services_models.Service.objects.select_related(
-            "service_type"
-        ).filter(id=service_id, active=True)
+        document = service_documents.get(service_id)
+        if document is None:
+            row = (
+                services_models.Service.objects.filter(id=service_id, active=True)
+                .values_list("id", "document")
+                .first()
+            )
+            if row:
+                document = documents.render([row])[0]
+                service_documents.set(service_id, document)
+        if document is not None:
+            return Response(document, status=status.HTTP_200_OK)
+        queryset = services_models.ArchivedService.objects.none()
+        if include_archived(request.query_params):
+            queryset = services_models.ArchivedService.objects.select_related(
+                "service_type"
+            ).filter(id=service_id)
         if not queryset.exists():
             raise exceptions.NotFound("Service not found")
         serializer = self.get_serializer(queryset.first())
@@ -204,14 +508,23 @@ class SeriviceOneView(GenericAPIView):
         },
     )
     def patch(self, request: Request, service_id: int) -> Response:
-        """partial update a service"""
+        """partial update a service, restoring it if it was archived"""
         queryset = services_models.Service.objects.filter(id=service_id)
-        if not queryset.exists():
-            raise exceptions.NotFound("Service not found")
-        data = request.data.copy()
-        serializer = self.get_serializer(queryset.first(), data=data, partial=True)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # an invalid update leaves an archived service in the archive
+        with transaction.atomic():
+            if not queryset.exists():
+                try:
+                    restored = archive.restore(service_id)
+                except IntegrityError:
+                    raise exceptions.ValidationError(
+                        "A service with this title and service type already exists"
+                    )
+                if not restored:
+                    raise exceptions.NotFound("Service not found")
+            data = request.data.copy()
+            serializer = self.get_serializer(queryset.first(), data=data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @views_schema.base_schema()